@@ -1,22 +1,51 @@
+import asyncio
+import collections
+import json
 import logging
 import os
+import msgpack
 import redis
 
 from enum import Enum
+from typing import Optional, Union
+from urllib.parse import parse_qs
 
 from dotenv import load_dotenv
-from channels.db import database_sync_to_async
 from channels.exceptions import DenyConnection
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 
+from apps.chat.metrics import consumer_metrics
+from apps.chat.throttling import TokenBucket, room_buckets
 from apps.user.models import User
+from config.db_executor import consumer_database_sync_to_async
 
 load_dotenv()
 logger = logging.getLogger("pintalk")
 
+# Sec-WebSocket-Protocol of clients exchanging msgpack binary frames instead of json text
+MSGPACK_SUBPROTOCOL = "pintalk.msgpack"
+
+
+def join_frames(frames: list) -> Union[str, bytes]:
+    """
+    encoded json texts or msgpack objects, as one encoded array
+    """
+    if isinstance(frames[0], str):
+        return f"[{','.join(frames)}]"
+
+    length = len(frames)
+    if length < 16:
+        header = bytes([0x90 | length])
+    elif length < 0x10000:
+        header = b"\xdc" + length.to_bytes(2, "big")
+    else:
+        header = b"\xdd" + length.to_bytes(4, "big")
+    return header + b"".join(frames)
+
 
 class UserType(Enum):
     GUEST = 0
@@ -24,6 +53,9 @@ class UserType(Enum):
 
 
 class BaseJsonConsumer(AsyncJsonWebsocketConsumer):
+    # frame types only carrying the latest state, see receive_ephemeral
+    EPHEMERAL_TYPES = ()
+
     def __init__(self, url_kwargs, name_prefix, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.url_kwargs = url_kwargs
@@ -38,6 +70,8 @@ class BaseJsonConsumer(AsyncJsonWebsocketConsumer):
         else:
             self.user_type = UserType.USER
 
+        self.use_msgpack = MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", ())
+
         self.room_name = self.scope["url_route"]["kwargs"][self.url_kwargs]
         self.room_group_name = f"{self.name_prefix}_{self.room_name}"
 
@@ -46,7 +80,48 @@ class BaseJsonConsumer(AsyncJsonWebsocketConsumer):
             host=os.environ.get("REDIS_HOST"), port=6379, db=0
         )
 
+        limits = settings.CHAT_SOCKET_LIMITS
+        self.connection_bucket = TokenBucket(
+            limits["CONNECTION_RATE"], limits["CONNECTION_BURST"]
+        )
+        self.room_bucket = room_buckets.acquire(
+            self.room_group_name, limits["ROOM_RATE"], limits["ROOM_BURST"]
+        )
+        self.ephemeral_bucket = TokenBucket(
+            limits["EPHEMERAL_RATE"], limits["EPHEMERAL_BURST"]
+        )
+        # latest ephemeral frame of each type held back by the ephemeral bucket
+        self.deferred_frames = {}
+        self.deferred_flush: Optional[asyncio.Future] = None
+
+        # frames are written by a single task, so a slow client only grows a bounded queue
+        self.outbound_queue = collections.deque()
+        self.outbound_ready = asyncio.Event()
+        self.is_slow = False
+        self.batch_frames = self.get_query_param("batch") == "1"
+        # clients opening with ?ack=1 acknowledge what they received, at most
+        # ACK_WINDOW frames are then in flight and the rest waits in the queue
+        self.ack_window = (
+            settings.CHAT_SOCKET_OUTBOUND["ACK_WINDOW"]
+            if self.get_query_param("ack") == "1"
+            else None
+        )
+        self.frames_sent = 0
+        self.frames_acked = 0
+        self.outbound_writer = asyncio.ensure_future(self.write_outbound())
+
     async def disconnect(self, close_code):
+        if hasattr(self, "room_bucket"):
+            room_buckets.release(self.room_group_name)
+
+        if getattr(self, "deferred_flush", None) is not None:
+            self.deferred_flush.cancel()
+
+        if hasattr(self, "outbound_writer"):
+            self.outbound_writer.cancel()
+            self.outbound_queue.clear()
+            self.set_slow(False)
+
         try:
             # Leave room group
             await self.channel_layer.group_discard(
@@ -55,10 +130,237 @@ class BaseJsonConsumer(AsyncJsonWebsocketConsumer):
         except Exception as e:
             print("Failed to leave group")
 
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        # size and rate are checked before the frame is decoded
+        frame = text_data if text_data is not None else bytes_data
+        max_frame_bytes = settings.CHAT_SOCKET_LIMITS["MAX_FRAME_BYTES"]
+        if len(frame) > max_frame_bytes // 4 and isinstance(frame, str):
+            frame = frame.encode("utf-8")
+        if len(frame) > max_frame_bytes:
+            logger.info("websocket frame too large")
+            await self.close(4013)
+            return
+
+        try:
+            if bytes_data is not None and self.use_msgpack:
+                content = msgpack.unpackb(bytes_data)
+            elif text_data is not None:
+                content = await self.decode_json(text_data)
+            else:
+                raise ValueError("No text section for incoming WebSocket frame!")
+        except (ValueError, msgpack.UnpackException):
+            await self.close(4000)
+            return
+
+        if isinstance(content, dict) and content.get("type") == "ack":
+            # flow control, not counted against the rate limits
+            await self.receive_ack(content)
+            return
+
+        if isinstance(content, dict) and content.get("type") in self.EPHEMERAL_TYPES:
+            await self.receive_ephemeral(content, **kwargs)
+            return
+
+        if not (self.connection_bucket.consume() and self.room_bucket.consume()):
+            logger.info("websocket frame rate exceeded")
+            await self.close(4029)
+            return
+
+        await self.receive_json(content, **kwargs)
+
+    async def receive_ephemeral(self, content, **kwargs):
+        """
+        frames like typing and read are coalesced anyway, so over their own limit they
+        are held back instead of closing the connection. only the latest one of each
+        type is kept and handled once the bucket refills
+        """
+        if not self.deferred_frames and self.ephemeral_bucket.consume():
+            await self.receive_json(content, **kwargs)
+            return
+
+        self.deferred_frames[content["type"]] = content
+        if self.deferred_flush is None or self.deferred_flush.done():
+            self.deferred_flush = asyncio.ensure_future(
+                self.flush_deferred_frames(**kwargs)
+            )
+
+    async def flush_deferred_frames(self, **kwargs):
+        while self.deferred_frames:
+            await asyncio.sleep(1 / self.ephemeral_bucket.rate)
+            while self.deferred_frames and self.ephemeral_bucket.consume():
+                frame_type = next(iter(self.deferred_frames))
+                await self.receive_json(self.deferred_frames.pop(frame_type), **kwargs)
+
+    async def receive_ack(self, content):
+        # count: websocket frames received so far, a batched array is one frame
+        count = content.get("count")
+        if (
+            isinstance(count, bool)
+            or not isinstance(count, int)
+            or not self.frames_acked <= count <= self.frames_sent
+        ):
+            await self.close(4000)
+            return
+
+        self.frames_acked = count
+        self.outbound_ready.set()
+
     async def receive_json(self, content, **kwargs):
         pass
 
-    @database_sync_to_async
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None:
+            self.enqueue_outbound({"type": "websocket.send", "text": text_data})
+        elif bytes_data is not None:
+            self.enqueue_outbound({"type": "websocket.send", "bytes": bytes_data})
+        else:
+            raise ValueError("You must pass one of bytes_data or text_data")
+
+        if close:
+            await self.close(close)
+
+    async def send_json(self, content, close=False):
+        if self.use_msgpack:
+            message = {"type": "websocket.send", "bytes": msgpack.packb(content)}
+        else:
+            message = {
+                "type": "websocket.send",
+                "text": await self.encode_json(content),
+            }
+        self.enqueue_outbound(message, self.coalesce_key(content))
+
+        if close:
+            await self.close(close)
+
+    async def send_encoded_json(self, text_data: str):
+        """
+        sends a frame already encoded as json, converted for msgpack clients
+        """
+        if self.use_msgpack:
+            await self.send_json(json.loads(text_data))
+        else:
+            await self.send(text_data=text_data)
+
+    async def accept(self, subprotocol=None):
+        if subprotocol is None and self.use_msgpack:
+            subprotocol = MSGPACK_SUBPROTOCOL
+        await super().accept(subprotocol)
+
+    async def close(self, code=None):
+        message = {"type": "websocket.close"}
+        if code is not None and code is not True:
+            message["code"] = code
+
+        if not hasattr(self, "outbound_writer"):
+            await self.base_send(message)
+        else:
+            # sent after the frames already queued
+            self.enqueue_outbound(message)
+
+    def coalesce_key(self, content) -> Optional[str]:
+        """
+        frames with the same key replace each other while queued, under the coalesce policy
+        """
+        return None
+
+    def enqueue_outbound(self, message: dict, coalesce_key: Optional[str] = None):
+        if self.outbound_writer.done():
+            # closed, or closing because the client was too slow
+            return
+
+        queue = self.outbound_queue
+        outbound = settings.CHAT_SOCKET_OUTBOUND
+        if message["type"] == "websocket.send":
+            if outbound["POLICY"] == "coalesce" and coalesce_key is not None:
+                for index, (key, _) in enumerate(queue):
+                    if key == coalesce_key:
+                        queue[index] = (key, message)
+                        consumer_metrics.coalesced_frames += 1
+                        return
+
+            if len(queue) >= outbound["MAX_QUEUED_FRAMES"]:
+                self.set_slow(True)
+                if outbound["POLICY"] == "close":
+                    consumer_metrics.slow_consumer_closes += 1
+                    logger.info("websocket closed, client too slow to receive")
+                    queue.clear()
+                    message, coalesce_key = {
+                        "type": "websocket.close",
+                        "code": 4008,
+                    }, None
+                else:
+                    consumer_metrics.dropped_frames += 1
+                    queue.popleft()
+
+        queue.append((coalesce_key, message))
+        self.outbound_ready.set()
+
+    def has_credit(self) -> bool:
+        return (
+            self.ack_window is None
+            or self.frames_sent - self.frames_acked < self.ack_window
+        )
+
+    async def write_outbound(self):
+        queue = self.outbound_queue
+        batch_window = settings.CHAT_SOCKET_OUTBOUND["BATCH_WINDOW"]
+        while True:
+            await self.outbound_ready.wait()
+            if self.batch_frames:
+                # let the rest of a burst arrive
+                await asyncio.sleep(batch_window)
+
+            while queue:
+                if queue[0][1]["type"] == "websocket.send" and not self.has_credit():
+                    # the client is behind, frames wait here where the outbound policy applies
+                    close = next(
+                        (m for _, m in queue if m["type"] == "websocket.close"), None
+                    )
+                    if close is None:
+                        break
+                    # closing anyway, what the client could not take is dropped
+                    queue.clear()
+                    queue.append((None, close))
+
+                if self.batch_frames and queue[0][1]["type"] == "websocket.send":
+                    # frames are already encoded, join them into one array
+                    field = "text" if "text" in queue[0][1] else "bytes"
+                    frames = []
+                    while queue and field in queue[0][1]:
+                        frames.append(queue.popleft()[1][field])
+                    self.frames_sent += 1
+                    await self.base_send(
+                        {"type": "websocket.send", field: join_frames(frames)}
+                    )
+                    continue
+
+                _, message = queue.popleft()
+                if message["type"] == "websocket.send":
+                    self.frames_sent += 1
+                await self.base_send(message)
+                if message["type"] == "websocket.close":
+                    self.set_slow(False)
+                    return
+            self.outbound_ready.clear()
+            if not queue:
+                self.set_slow(False)
+
+    def get_query_param(self, name: str) -> Optional[str]:
+        qs: dict = parse_qs(self.scope["query_string"].decode("utf8"))
+        return qs.get(name, [None])[0]
+
+    def set_slow(self, is_slow: bool):
+        if is_slow == self.is_slow:
+            return
+
+        self.is_slow = is_slow
+        if is_slow:
+            consumer_metrics.slow_consumers += 1
+            logger.warning(f"slow websocket consumer, {consumer_metrics.snapshot()}")
+        else:
+            consumer_metrics.slow_consumers -= 1
+
+    @consumer_database_sync_to_async
     def check_valid_guest(self) -> bool:
         origin = None
         for header_tuple in self.scope["headers"]:
@@ -1,17 +1,18 @@
+import asyncio
 import logging
-from typing import Union
+import time
+from typing import Optional, Union
 
 from dotenv import load_dotenv
 
-from channels.db import database_sync_to_async
 from channels.exceptions import DenyConnection
 
-from datetime import datetime
-
 from apps.chat.consumers.base_consumer import BaseJsonConsumer, UserType
 from apps.chat.models import Chatroom
-from apps.chat.serializers import ChatroomSerializer
-from apps.chat.services import ChatConsumerService
+from apps.chat.services import ChatConsumerService, ChatroomService
+from apps.chat.validators import ChatFrame, validate_chat_frame
+from apps.user.models import User
+from config.db_executor import consumer_database_sync_to_async
 from config.exceptions import InvalidInputException
 
 load_dotenv()
@@ -20,14 +21,26 @@ logger = logging.getLogger("pintalk")
 
 
 class ChatConsumer(BaseJsonConsumer):
+    EPHEMERAL_TYPES = ("typing", "read")
+    # seconds during which repeated typing events of a connection are not relayed
+    TYPING_INTERVAL = 1.0
+    # read markers of a host are broadcast at most once in this many seconds
+    READ_BROADCAST_DELAY = 0.5
+
     def __init__(self, *args, **kwargs):
         super().__init__("room_name", "chat", *args, **kwargs)
+        self.is_typing = False
+        self.typing_sent_at = 0.0
+        self.read_broadcast: Optional[asyncio.Future] = None
 
     async def connect(self):
         await super().connect()
 
         # 유효한 chatroom name 인지 확인
         chatroom = await self.get_chatroom_instance()
+        if chatroom is None and self.user_type == UserType.GUEST:
+            # not saved before the guest's first message, see materialize_chatroom
+            chatroom = await self.get_reserved_chatroom()
         if chatroom is None:
             logger.info("invalid chatroom name")
             await self.deny_connection(4004)
@@ -56,6 +69,8 @@ class ChatConsumer(BaseJsonConsumer):
         self.service = ChatConsumerService(
             self.room_group_name, self.chatroom, self.redis_conn
         )
+        if self.chatroom.pk is not None:
+            await self.ensure_sequence()
 
         try:
             # Join room group
@@ -67,40 +82,66 @@ class ChatConsumer(BaseJsonConsumer):
             else:
                 logger.info(f"Registered user <{self.user}> joined the chat room")
 
-            # latest messages, max 50
-            past_messages = self.service.get_past_messages()
+            # only the messages missed since the client's cursor, if it has one
+            cursor = self.get_resume_cursor()
+            missed_messages = None
+            if cursor is not None:
+                missed_messages = self.service.get_missed_messages(cursor)
 
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "data": past_messages,
-                    "type": "chat_message",
-                    "for_host": bool(self.user_type.value),
-                },
-            )
+            if missed_messages is not None:
+                await self.send_json(
+                    {"data": missed_messages, "type": "chat_message", "resumed": True}
+                )
+            else:
+                # latest messages, max 50, already serialized
+                await self.send_encoded_json(self.service.get_latest_page_raw())
+
+            if self.user_type == UserType.GUEST:
+                read_seq = self.service.get_read_seq()
+                if read_seq is not None:
+                    await self.send_json({"type": "read", "seq": read_seq})
 
         except Exception as e:
             print(e)
             raise DenyConnection(e)
 
+    def get_resume_cursor(self) -> Optional[int]:
+        # ?cursor=<seq of the latest message the client has>
+        cursor = self.get_query_param("cursor")
+        if cursor is None or not cursor.isdigit():
+            return None
+        return int(cursor)
+
     async def disconnect(self, close_code):
         if hasattr(self, "service") and hasattr(self, "room_group_name"):
             await self.save_latest_message()
+            if self.is_typing:
+                await self.relay_typing(False)
+            if self.read_broadcast is not None and not self.read_broadcast.done():
+                # send the pending marker now rather than dropping it
+                self.read_broadcast.cancel()
+                await self.broadcast_read(delay=0)
+            if self.user_type == UserType.USER:
+                await self.save_read_seq()
 
         await super().disconnect(close_code)
 
     # Receive message from WebSocket
     async def receive_json(self, content, **kwargs):
         if content["type"] == "request":
-            request_msg_datetime = content.get("message", None)
-            if request_msg_datetime is None or len(request_msg_datetime) != 23:
+            # seq of the oldest message the client has, or its datetime for older clients
+            starting_point = content.get("message", None)
+            if isinstance(starting_point, bool) or not (
+                isinstance(starting_point, int)
+                or (
+                    isinstance(starting_point, str)
+                    and (starting_point.isdigit() or len(starting_point) == 23)
+                )
+            ):
                 await self.deny_connection(4000)
 
             try:
-                past_messages = self.service.get_past_messages(
-                    is_ascending=False,
-                    starting_point=request_msg_datetime,
-                )
+                past_messages = await self.get_past_messages(starting_point)
                 await self.channel_layer.group_send(
                     self.room_group_name,
                     {
@@ -113,13 +154,51 @@ class ChatConsumer(BaseJsonConsumer):
                 await self.close(4000)
 
         elif content["type"] == "chat_message":
-            saved_message = self.service.save_msg_in_mem(content)
+            try:
+                frame = validate_chat_frame(content)
+            except InvalidInputException:
+                await self.close(4000)
+                return
+
+            # saved before anything is written to redis, the name may belong to another host
+            if self.chatroom.pk is None and not await self.materialize_chatroom(frame):
+                logger.info("reserved chatroom name taken by another host")
+                await self.close(4004)
+                return
+
+            saved_message, is_new = self.service.save_frame_in_mem(frame)
+            if not is_new:
+                # retried message, already broadcast and saved. only confirm it to the sender
+                await self.send_json(saved_message.as_dict())
+                return
 
             # Send message to room group
-            await self.channel_layer.group_send(self.room_group_name, saved_message)
+            await self.channel_layer.group_send(
+                self.room_group_name, saved_message.as_dict()
+            )
+            # the other side stops showing the indicator when the message arrives
+            self.is_typing = False
 
             await self.save_message_db(saved_message)
 
+        elif content["type"] == "read":
+            # seq of the latest message the host has seen
+            seq = content.get("seq")
+            if isinstance(seq, bool) or not isinstance(seq, int):
+                await self.close(4000)
+                return
+            if self.user_type != UserType.USER:
+                return
+
+            if self.service.mark_read(seq) is not None and (
+                self.read_broadcast is None or self.read_broadcast.done()
+            ):
+                self.read_broadcast = asyncio.ensure_future(self.broadcast_read())
+
+        elif content["type"] == "typing":
+            # ephemeral, only relayed to the other side
+            await self.relay_typing(content.get("is_typing") is not False)
+
         elif content["type"] == "notice" and content["message"] == "close":
             await self.close_chatroom()
 
@@ -156,8 +235,50 @@ class ChatConsumer(BaseJsonConsumer):
     async def request(self, event):
         await self.send_json(event)
 
-    @database_sync_to_async
+    async def typing(self, event):
+        if event["is_host"] != (self.user_type == UserType.USER):
+            await self.send_json(event)
+
+    async def relay_typing(self, is_typing: bool) -> None:
+        # keystrokes in a row are coalesced, a change of state is relayed at once
+        now = time.monotonic()
+        if (
+            is_typing == self.is_typing
+            and now - self.typing_sent_at < self.TYPING_INTERVAL
+        ):
+            return
+
+        self.is_typing = is_typing
+        self.typing_sent_at = now
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "typing",
+                "is_host": self.user_type == UserType.USER,
+                "is_typing": is_typing,
+            },
+        )
+
+    async def read(self, event):
+        if self.user_type == UserType.GUEST:
+            await self.send_json(event)
+
+    async def broadcast_read(self, delay: Optional[float] = None) -> None:
+        # markers moved while waiting are sent as one event with the latest seq
+        await asyncio.sleep(self.READ_BROADCAST_DELAY if delay is None else delay)
+        await self.channel_layer.group_send(
+            self.room_group_name, {"type": "read", "seq": self.service.get_read_seq()}
+        )
+
+    def coalesce_key(self, content) -> Optional[str]:
+        if content.get("type") in ("typing", "read"):
+            return content["type"]
+        return None
+
+    @consumer_database_sync_to_async
     def save_latest_message(self) -> None:
+        if self.chatroom.pk is None:
+            return
         latest_message = self.service.get_latest_message()
         if latest_message is not None:
             if self.user_type == UserType.GUEST:
@@ -167,21 +288,35 @@ class ChatConsumer(BaseJsonConsumer):
         else:
             pass
 
-    @database_sync_to_async
-    def save_message_db(self, msg_obj: dict) -> None:
-        self.service.save_chat_message_db(msg_obj)
+    @consumer_database_sync_to_async
+    def save_read_seq(self) -> None:
+        self.service.save_read_seq_db()
+
+    @consumer_database_sync_to_async
+    def ensure_sequence(self) -> None:
+        self.service.ensure_sequence()
 
-    @database_sync_to_async
+    @consumer_database_sync_to_async
+    def get_past_messages(self, starting_point: Union[int, str, None]) -> list:
+        # pages older than redis holds are read from db
+        return self.service.get_past_messages(
+            is_ascending=False, starting_point=starting_point
+        )
+
+    @consumer_database_sync_to_async
+    def save_message_db(self, frame: ChatFrame) -> None:
+        self.service.save_chat_message_db(frame)
+
+    @consumer_database_sync_to_async
     def close_chatroom(self) -> None:
-        data = {"is_closed": True}
-        serializer = ChatroomSerializer(self.chatroom, data=data, partial=True)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(updated_at=datetime.now(), closed_at=datetime.now())
+        if self.chatroom.pk is None:
+            # nothing was said, nothing to keep
+            self.service.delete_chatroom_messages_mem()
+            return
 
-        self.save_latest_message()
-        self.service.delete_chatroom_messages_mem()
+        self.service.close_chatroom(is_guest=self.user_type == UserType.GUEST)
 
-    @database_sync_to_async
+    @consumer_database_sync_to_async
     def get_chatroom_instance(self) -> Union[Chatroom, None]:
         try:
             chatroom = (
@@ -193,9 +328,29 @@ class ChatConsumer(BaseJsonConsumer):
         except Chatroom.DoesNotExist:
             return None
 
-    @database_sync_to_async
+    @consumer_database_sync_to_async
+    def get_reserved_chatroom(self) -> Union[Chatroom, None]:
+        chatroom = ChatroomService.load_reservation(
+            self.get_query_param("reservation"), name=self.room_name
+        )
+        if chatroom is None:
+            return None
+        chatroom.host = User.objects.filter(id=chatroom.host_id).first()
+        if chatroom.host is None:
+            return None
+        return chatroom
+
+    @consumer_database_sync_to_async
+    def materialize_chatroom(self, frame: ChatFrame) -> bool:
+        chatroom = ChatroomService.materialize_chatroom(self.chatroom, frame)
+        if chatroom is None:
+            return False
+        chatroom.host = self.host
+        self.chatroom = chatroom
+        self.service.chatroom = chatroom
+        return True
+
+    @consumer_database_sync_to_async
     def reopen_chatroom(self):
-        data = {"is_closed": False}
-        serializer = ChatroomSerializer(self.chatroom, data=data, partial=True)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(updated_at=datetime.now(), closed_at=None)
+        Chatroom.objects.mark_reopened(self.chatroom.id)
+        self.chatroom.is_closed = False
@@ -1,16 +1,16 @@
 import logging
 from datetime import datetime
-from typing import Union
+from typing import Optional, Union
 
-from channels.db import database_sync_to_async
 from channels.exceptions import DenyConnection
-from rest_framework.exceptions import ValidationError
 
 from apps.chat.consumers.base_consumer import BaseJsonConsumer
 from apps.chat.consumers.chat_consumer import UserType
-from apps.chat.serializers import ChatMessageInMemorySerializer
 from apps.chat.services import StatusConsumerService
+from apps.chat.validators import validate_chat_frame
 from apps.user.models import User
+from config.db_executor import consumer_database_sync_to_async
+from config.exceptions import InvalidInputException
 
 logger = logging.getLogger("pintalk")
 
@@ -83,13 +83,7 @@ class ActiveStatusConsumer(BaseJsonConsumer):
                 self.room_group_name, self.service.update_status_in_mem(status_message)
             )
 
-        try:
-            # Leave room group
-            await self.channel_layer.group_discard(
-                self.room_group_name, self.channel_name
-            )
-        except Exception as e:
-            print("Failed to leave group")
+        await super().disconnect(close_code)
 
     # Receive message from WebSocket
     async def receive_json(self, content, **kwargs):
@@ -105,11 +99,14 @@ class ActiveStatusConsumer(BaseJsonConsumer):
         elif self.user_type == UserType.USER and not event["is_host"]:
             await self.send_json(event)
 
+    def coalesce_key(self, content) -> Optional[str]:
+        # only the latest status of each side matters
+        return f"status_{content.get('is_host')}"
+
     async def serialize_content(self, content) -> None:
-        serializer = ChatMessageInMemorySerializer(data=content)
         try:
-            serializer.is_valid(raise_exception=True)
-        except ValidationError:
+            validate_chat_frame(content)
+        except InvalidInputException:
             return await self.close(code=4000)
 
     @staticmethod
@@ -126,7 +123,7 @@ class ActiveStatusConsumer(BaseJsonConsumer):
             "datetime": datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3],
         }
 
-    @database_sync_to_async
+    @consumer_database_sync_to_async
     def get_user_instance(self) -> Union[User, None]:
         try:
             user = (
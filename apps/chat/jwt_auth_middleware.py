@@ -7,7 +7,6 @@ django.setup()
 from urllib.parse import parse_qs
 
 from channels.auth import AuthMiddlewareStack
-from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
 from django.db import close_old_connections
@@ -18,11 +17,12 @@ from rest_framework_simplejwt.tokens import UntypedToken
 from jwt import decode as jwt_decode
 
 from apps.user.models import User
+from config.db_executor import consumer_database_sync_to_async
 
 logger = logging.getLogger("pintalk")
 
 
-@database_sync_to_async
+@consumer_database_sync_to_async
 def get_user(validated_token):
     try:
         user = User.objects.select_related("configs").get(id=validated_token["user_id"])
@@ -71,4 +71,7 @@ class JwtAuthMiddleware(BaseMiddleware):
 
 
 def JwtAuthMiddlewareStack(inner):
+    if settings.LEAN_WEBSOCKET_AUTH:
+        # the session lookup of AuthMiddlewareStack would only be overwritten by the jwt user
+        return JwtAuthMiddleware(inner)
     return JwtAuthMiddleware(AuthMiddlewareStack(inner))
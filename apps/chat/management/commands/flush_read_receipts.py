@@ -0,0 +1,25 @@
+import os
+
+import redis
+from django.core.management.base import BaseCommand
+
+from apps.chat.services import ReadReceiptService
+
+
+class Command(BaseCommand):
+    help = "Writes the read markers coalesced in redis to the chatroom table, meant to run periodically"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="chatrooms updated per query",
+        )
+
+    def handle(self, *args, **options):
+        redis_conn = redis.StrictRedis(
+            host=os.environ.get("REDIS_HOST"), port=6379, db=0
+        )
+        flushed = ReadReceiptService(redis_conn).flush_dirty(options["batch_size"])
+        self.stdout.write(f"{flushed} chatroom read markers flushed")
@@ -0,0 +1,77 @@
+import os
+from datetime import datetime, timedelta
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.chat.services import SweeperService
+
+
+class Command(BaseCommand):
+    help = (
+        "Closes idle chatrooms, deletes old chatrooms without any message and expires "
+        "the redis keys of closed or deleted chatrooms and gone hosts, meant to run periodically"
+    )
+
+    def add_arguments(self, parser):
+        sweeper = settings.CHAT_SWEEPER
+        parser.add_argument(
+            "--idle-chatroom-timeout",
+            type=int,
+            default=sweeper["IDLE_CHATROOM_TIMEOUT"],
+            help="seconds without a message after which an open chatroom is closed",
+        )
+        parser.add_argument(
+            "--empty-chatroom-age",
+            type=int,
+            default=sweeper["EMPTY_CHATROOM_AGE"],
+            help="seconds after which a chatroom without any message is deleted",
+        )
+        parser.add_argument(
+            "--orphan-key-ttl",
+            type=int,
+            default=sweeper["ORPHAN_KEY_TTL"],
+            help="seconds left to orphaned redis keys",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=sweeper["BATCH_SIZE"],
+            help="chatrooms deleted per query and redis keys checked per SCAN batch",
+        )
+        parser.add_argument(
+            "--seed",
+            action="store_true",
+            help="first adds the chatrooms already in redis to the idle chatroom tracking, "
+            "needed once after upgrading",
+        )
+
+    def handle(self, *args, **options):
+        redis_conn = redis.StrictRedis(
+            host=os.environ.get("REDIS_HOST"), port=6379, db=0
+        )
+        service = SweeperService(redis_conn)
+        batch_size = options["batch_size"]
+        ttl = options["orphan_key_ttl"]
+
+        if options["seed"]:
+            seeded = service.seed_active_chatrooms(batch_size)
+            self.stdout.write(f"{seeded} chatrooms added to the idle chatroom tracking")
+
+        closed = service.close_idle_chatrooms(
+            options["idle_chatroom_timeout"], batch_size
+        )
+        deleted = service.delete_empty_chatrooms(
+            datetime.now() - timedelta(seconds=options["empty_chatroom_age"]),
+            batch_size,
+        )
+        chat_keys = service.expire_orphaned_chat_keys(ttl, batch_size)
+        status_keys = service.expire_orphaned_status_keys(ttl, batch_size)
+
+        self.stdout.write(f"{closed} idle chatrooms closed")
+        self.stdout.write(f"{deleted} empty chatrooms deleted")
+        self.stdout.write(
+            f"{chat_keys} chatroom keys and {status_keys} status keys "
+            f"set to expire in {ttl} seconds"
+        )
@@ -0,0 +1,22 @@
+class ConsumerMetrics:
+    """
+    in-process counters of websocket consumers, reported through the pintalk logger
+    """
+
+    def __init__(self):
+        # connections whose outbound queue is currently full
+        self.slow_consumers = 0
+        self.dropped_frames = 0
+        self.coalesced_frames = 0
+        self.slow_consumer_closes = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "slow_consumers": self.slow_consumers,
+            "dropped_frames": self.dropped_frames,
+            "coalesced_frames": self.coalesced_frames,
+            "slow_consumer_closes": self.slow_consumer_closes,
+        }
+
+
+consumer_metrics = ConsumerMetrics()
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-19 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0013_remove_chatroom_fixed_at_remove_chatroom_is_fixed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="seq",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["chatroom", "seq"], name="chat_messag_chatroo_9cfd8e_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-19 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0014_chatmessage_seq"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="client_msg_id",
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="chatmessage",
+            constraint=models.UniqueConstraint(
+                fields=("chatroom", "client_msg_id"),
+                name="unique_chat_message_client_msg_id",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0015_chatmessage_client_msg_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatroom",
+            name="last_read_seq",
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0016_chatroom_last_read_seq"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="chatroom",
+            name="name",
+            field=models.CharField(max_length=22, unique=True),
+        ),
+    ]
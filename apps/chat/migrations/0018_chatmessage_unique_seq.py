@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-19 21:06
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_seqs(apps, schema_editor):
+    # a close racing the sender's save wrote the same message twice, the first row is kept
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    duplicates = (
+        ChatMessage.objects.filter(seq__isnull=False)
+        .values("chatroom_id", "seq")
+        .annotate(first_id=Min("id"), count=Count("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        ChatMessage.objects.filter(
+            chatroom_id=duplicate["chatroom_id"], seq=duplicate["seq"]
+        ).exclude(id=duplicate["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0017_alter_chatroom_name"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_seqs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="chatmessage",
+            constraint=models.UniqueConstraint(
+                fields=("chatroom", "seq"), name="unique_chat_message_seq"
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="chatmessage",
+            name="chat_messag_chatroo_9cfd8e_idx",
+        ),
+    ]
@@ -1,19 +1,77 @@
+from datetime import datetime
+from typing import Dict, Optional
+
 from django.db import models
+from django.db.models import Case, Value, When
+from django.db.models.functions import Coalesce, Greatest
 
 from apps.user.models import User, TimeStampMixin
 
 
+class ChatroomManager(models.Manager):
+    """
+    Targeted UPDATEs for internal chatroom state transitions.
+    Only the changed columns are written, without going through a serializer.
+    """
+
+    def mark_closed(self, chatroom_id: int) -> int:
+        now = datetime.now()
+        return self.filter(id=chatroom_id).update(
+            is_closed=True, closed_at=now, updated_at=now
+        )
+
+    def mark_reopened(self, chatroom_id: int) -> int:
+        return self.filter(id=chatroom_id).update(
+            is_closed=False, closed_at=None, updated_at=datetime.now()
+        )
+
+    def update_latest_message(
+        self,
+        chatroom_id: int,
+        latest_msg: str,
+        latest_msg_at: datetime,
+        last_checked_at: Optional[datetime] = None,
+    ) -> int:
+        fields = dict(
+            latest_msg=latest_msg,
+            latest_msg_at=latest_msg_at,
+            updated_at=datetime.now(),
+        )
+        if last_checked_at is not None:
+            fields["last_checked_at"] = last_checked_at
+        return self.filter(id=chatroom_id).update(**fields)
+
+    def update_last_read_seqs(self, read_seqs: Dict[str, int]) -> int:
+        """
+        one UPDATE for the read markers of many chatrooms, by chatroom name.
+        a marker never moves backwards
+        """
+        if not read_seqs:
+            return 0
+        read_seq = Case(
+            *[When(name=name, then=Value(seq)) for name, seq in read_seqs.items()],
+            output_field=models.BigIntegerField(),
+        )
+        return self.filter(name__in=read_seqs.keys()).update(
+            last_read_seq=Greatest(Coalesce("last_read_seq", 0), read_seq)
+        )
+
+
 class Chatroom(TimeStampMixin):
     id = models.BigAutoField(primary_key=True)
     host = models.ForeignKey(User, on_delete=models.CASCADE)
     guest = models.CharField(max_length=20, null=False, blank=False)
-    name = models.CharField(max_length=22, null=False, blank=False)
+    name = models.CharField(max_length=22, null=False, blank=False, unique=True)
     latest_msg = models.CharField(max_length=2000, null=True)
     latest_msg_at = models.DateTimeField(null=True)
     last_checked_at = models.DateTimeField(null=True)
+    # seq of the latest message read by the host
+    last_read_seq = models.BigIntegerField(null=True)
     is_closed = models.BooleanField(default=False, null=False)
     closed_at = models.DateTimeField(null=True)
 
+    objects = ChatroomManager()
+
     class Meta:
         db_table = "chatroom"
 
@@ -30,9 +88,22 @@ class ChatMessage(models.Model):
     message = models.CharField(max_length=2000, null=False)
     is_host = models.BooleanField(null=False, blank=False)
     datetime = models.DateTimeField(null=False)
+    seq = models.BigIntegerField(null=True)
+    client_msg_id = models.CharField(max_length=64, null=True)
 
     class Meta:
         db_table = "chat_message"
+        constraints = [
+            # a message closed into db while its sender's save is still queued is written once.
+            # legacy messages without seq are not constrained, NULLs never collide
+            models.UniqueConstraint(
+                fields=["chatroom", "seq"], name="unique_chat_message_seq"
+            ),
+            models.UniqueConstraint(
+                fields=["chatroom", "client_msg_id"],
+                name="unique_chat_message_client_msg_id",
+            ),
+        ]
 
     def __str__(self):
         return f"[{self.id}] chatroom: {self.chatroom_id}"
@@ -1,19 +1,20 @@
-import datetime
-
 from rest_framework import serializers
 
 from apps.chat.models import Chatroom, ChatMessage
 from apps.user.serializers import UserSerializer, ClientSerializer
+from config.sparse_fields import SparseFieldsSerializerMixin
 
 
-class ChatMessageSerializer(serializers.ModelSerializer):
+class ChatMessageSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
-        fields = ["id", "chatroom", "message", "is_host", "datetime"]
-        read_only_fields = ["id", "chatroom"]
+        fields = ["id", "chatroom", "message", "is_host", "datetime", "seq"]
+        read_only_fields = ["id", "chatroom", "seq"]
 
 
-class SimpleChatroomSerializer(serializers.ModelSerializer):
+class SimpleChatroomSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = Chatroom
         fields = [
@@ -24,6 +25,7 @@ class SimpleChatroomSerializer(serializers.ModelSerializer):
             "latest_msg",
             "latest_msg_at",
             "last_checked_at",
+            "last_read_seq",
             "is_closed",
             "closed_at",
             "created_at",
@@ -33,13 +35,14 @@ class SimpleChatroomSerializer(serializers.ModelSerializer):
             "id",
             "host",
             "name",
+            "last_read_seq",
             "closed_at",
             "created_at",
             "updated_at",
         ]
 
 
-class ChatroomSerializer(serializers.ModelSerializer):
+class ChatroomSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     host = UserSerializer(read_only=True)
 
     class Meta:
@@ -52,6 +55,7 @@ class ChatroomSerializer(serializers.ModelSerializer):
             "latest_msg",
             "latest_msg_at",
             "last_checked_at",
+            "last_read_seq",
             "is_closed",
             "closed_at",
             "created_at",
@@ -61,13 +65,16 @@ class ChatroomSerializer(serializers.ModelSerializer):
             "id",
             "host",
             "name",
+            "last_read_seq",
             "closed_at",
             "created_at",
             "updated_at",
         ]
 
 
-class ChatroomClientSerializer(serializers.ModelSerializer):
+class ChatroomClientSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
     host = ClientSerializer(read_only=True)
 
     class Meta:
@@ -89,22 +96,3 @@ class ChatroomClientSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
-
-
-class ChatMessageInMemorySerializer(serializers.Serializer):
-    type = serializers.ChoiceField(
-        choices=["chat_message", "notice", "request", "status"], required=True
-    )
-    message = serializers.CharField(max_length=1000, min_length=1, required=True)
-    is_host = serializers.BooleanField(required=True)
-    datetime = serializers.CharField(max_length=23, required=True)
-
-    class Meta:
-        fields = ["type", "message", "is_host", "datetime"]
-
-    def validate_datetime(self, value):
-        try:
-            datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
-        except ValueError:
-            raise ValueError("Incorrect data format, should be YYYY-MM-DDTHH:MM:SS.sss")
-        return value
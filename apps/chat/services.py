@@ -1,55 +1,304 @@
+import asyncio
 import json
 import os
+import time
 import uuid
-from datetime import datetime
-from typing import Union, List, Optional
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Iterable, Union, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 
+import msgpack
 import redis
 import shortuuid
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError
+from django.db.models import Exists, OuterRef
 from redis.client import Redis
+from redis.exceptions import WatchError
 from rest_framework.request import Request
 
 from apps.chat.models import Chatroom, ChatMessage
-from apps.chat.serializers import (
-    ChatMessageInMemorySerializer,
-    ChatMessageSerializer,
-    ChatroomSerializer,
-)
+from apps.chat.validators import ChatFrame, parse_frame_datetime, validate_chat_frame
+from apps.user.models import User
 from config.exceptions import InvalidInputException
+from utils.random_nickname import generate_random_nickname
 
 load_dotenv()
 
 
+# Sorted set members are stored as a version byte followed by a msgpack array
+# [type code, is_host, message, timestamp as YYYYMMDDHHMMSSsss, seq].
+# Chat rooms are scored by their per-room sequence number.
+# Members written before this layout are either version 1 arrays without seq
+# or plain json objects (they start with "{"); their seq is their score.
+MEMBER_VERSION_COMPACT = 1
+MEMBER_VERSION_SEQUENCED = 2
+MEMBER_TYPES = ("chat_message", "notice", "request", "status")
+MEMBER_TYPE_CODES = {name: code for code, name in enumerate(MEMBER_TYPES)}
+
+# scores of rooms written before sequence numbers are 17 digit timestamps
+LEGACY_SCORE_THRESHOLD = 10**15
+
+# KEYS[1]: room sorted set, KEYS[2]: room sequence counter, ARGV[1]: sequence seed
+# Initialises a missing counter, renumbering rooms that are still scored by timestamp.
+INIT_SEQUENCE_LUA = """
+local function init_sequence(room_key, seq_key, seed)
+    if redis.call('EXISTS', seq_key) == 1 then
+        return
+    end
+    local seq = seed
+    local top = redis.call('ZRANGE', room_key, -1, -1, 'WITHSCORES')
+    if #top > 0 and tonumber(top[2]) < %d then
+        seq = math.max(seq, tonumber(top[2]))
+    elseif #top > 0 then
+        local members = redis.call('ZRANGE', room_key, 0, -1)
+        for i, member in ipairs(members) do
+            redis.call('ZADD', room_key, seed + i, member)
+        end
+        seq = seed + #members
+    end
+    redis.call('SET', seq_key, seq)
+end
+""" % (
+    LEGACY_SCORE_THRESHOLD
+)
+
+# KEYS[1]: room sorted set, KEYS[2]: room sequence counter, KEYS[3]: seq of the client message id,
+# KEYS[4]: pre-serialized latest page, KEYS[5]: ACTIVE_KEY
+# ARGV[1]: member without its trailing seq element, ARGV[2]: client message id or "",
+# ARGV[3]: client message id ttl, ARGV[4]: json of the message up to its seq value, ARGV[5]: page size,
+# ARGV[6]: unix time of the append
+# Returns the new seq, or the negated seq of the original message for a retried client message id.
+APPEND_MESSAGE_LUA = (
+    INIT_SEQUENCE_LUA
+    + """
+if ARGV[2] ~= '' then
+    local original_seq = redis.call('GET', KEYS[3])
+    if original_seq then
+        return -tonumber(original_seq)
+    end
+end
+init_sequence(KEYS[1], KEYS[2], 0)
+local seq = redis.call('INCR', KEYS[2])
+-- msgpack uint32: 0xce followed by 4 big endian bytes
+local packed_seq = string.char(
+    0xce,
+    math.floor(seq / 16777216) % 256,
+    math.floor(seq / 65536) % 256,
+    math.floor(seq / 256) % 256,
+    seq % 256
+)
+redis.call('ZADD', KEYS[1], seq, ARGV[1] .. packed_seq)
+if ARGV[2] ~= '' then
+    -- one key per id, every id expires on its own even in a busy room
+    redis.call('SET', KEYS[3], seq, 'NX', 'EX', ARGV[3])
+end
+-- keep the page in step with the room, it is only started here for a room that was empty
+if redis.call('EXISTS', KEYS[4]) == 1 or redis.call('ZCARD', KEYS[1]) == 1 then
+    redis.call('RPUSH', KEYS[4], ARGV[4] .. seq .. '}')
+    redis.call('LTRIM', KEYS[4], -tonumber(ARGV[5]), -1)
+end
+redis.call('ZADD', KEYS[5], ARGV[6], KEYS[1])
+return seq
+"""
+)
+
+# names of chatrooms whose read marker changed since the last flush to db
+READ_DIRTY_KEY = "chat:read:dirty"
+
+# chatroom keys scored by the unix time of their latest message, for closing idle chatrooms
+ACTIVE_KEY = "chat:active"
+
+# signs the chatroom reservations handed to guests before their chatroom is saved
+RESERVATION_SALT = "pintalk.chatroom.reservation"
+
+# KEYS[1]: room read marker, KEYS[2]: room sequence counter, KEYS[3]: READ_DIRTY_KEY
+# ARGV[1]: seq read by the host, ARGV[2]: chatroom name
+# Returns the new marker, or 0 when it did not move forward.
+MARK_READ_LUA = """
+local seq = math.min(tonumber(ARGV[1]), tonumber(redis.call('GET', KEYS[2]) or '0'))
+if seq <= tonumber(redis.call('GET', KEYS[1]) or '0') then
+    return 0
+end
+redis.call('SET', KEYS[1], seq)
+redis.call('SADD', KEYS[3], ARGV[2])
+return seq
+"""
+
+ENSURE_SEQUENCE_LUA = (
+    INIT_SEQUENCE_LUA
+    + """
+init_sequence(KEYS[1], KEYS[2], tonumber(ARGV[1]))
+return redis.call('GET', KEYS[2])
+"""
+)
+
+
+@lru_cache(maxsize=None)
+def get_shared_redis() -> Redis:
+    """
+    redis client shared by the process, for request handlers that keep no connection of their own.
+    Its connection pool is thread safe
+    """
+    return redis.StrictRedis(host=os.environ.get("REDIS_HOST"), port=6379, db=0)
+
+
 class RedisService:
     def __init__(self, redis_conn: Redis):
         self.redis_conn = redis_conn
+        self.append_script = redis_conn.register_script(APPEND_MESSAGE_LUA)
+        self.ensure_sequence_script = redis_conn.register_script(ENSURE_SEQUENCE_LUA)
+        self.mark_read_script = redis_conn.register_script(MARK_READ_LUA)
 
     def get_latest_obj(self, key: str) -> Union[dict, None]:
-        latest_message = self.redis_conn.zrevrangebyscore(
-            key,
-            datetime.now().strftime("%Y%m%d%H%M%S"),
-            "-9999999999",
-            start=0,
-            num=1,
-        )
+        latest_message = self.redis_conn.zrange(key, -1, -1, withscores=True)
         if len(latest_message) == 0:
             return None
         else:
-            json_dict = latest_message[0].decode("utf-8")
-            return dict(json.loads(json_dict))
+            return self.decode_member(*latest_message[0])
+
+    def save_obj(self, key: str, frame: ChatFrame) -> ChatFrame:
+        self.redis_conn.zadd(
+            key,
+            {self.encode_member(frame): frame.score},
+        )
+        return frame
 
-    def save_obj(self, key: str, msg_obj: dict) -> dict:
-        serializer = ChatMessageInMemorySerializer(data=msg_obj)
-        if serializer.is_valid(raise_exception=True):
-            data = serializer.data
-            json_msg = json.dumps(data, ensure_ascii=False).encode("utf-8")
-            score = self.datetime_str_to_score_format(data["datetime"])
-            self.redis_conn.zadd(
-                key,
-                {json_msg: score},
+    def append_obj(
+        self,
+        key: str,
+        frame: ChatFrame,
+        message_id_ttl: int = 300,
+        page_size: int = 50,
+    ) -> Tuple[ChatFrame, bool]:
+        """
+        appends a message scored by the next sequence number of the room,
+        assigned atomically in the same round trip, along with the room's latest page.
+        a client message id already seen within message_id_ttl is not appended again,
+        the frame is returned with the seq of the original message and False
+        """
+        page_item = self.encode_page_item(frame.as_dict())
+        seq = int(
+            self.append_script(
+                keys=[
+                    key,
+                    self.sequence_key(key),
+                    self.message_id_key(key, frame.client_msg_id or ""),
+                    self.page_key(key),
+                    ACTIVE_KEY,
+                ],
+                args=[
+                    self.encode_member(frame, MEMBER_VERSION_SEQUENCED),
+                    frame.client_msg_id or "",
+                    message_id_ttl,
+                    # everything but the closing brace, the seq is appended by the script
+                    page_item[: page_item.rindex(b"}")] + b', "seq": ',
+                    page_size,
+                    time.time(),
+                ],
             )
-            return serializer.validated_data
+        )
+        if seq < 0:
+            return frame._replace(seq=-seq), False
+        return frame._replace(seq=seq), True
+
+    def restore_messages(self, key: str, frames: List[ChatFrame]) -> None:
+        """
+        puts back messages saved to db, scored by their seq
+        """
+        self.redis_conn.zadd(
+            key,
+            {
+                self.encode_member(frame, MEMBER_VERSION_SEQUENCED)
+                + msgpack.packb(frame.seq): frame.seq
+                for frame in frames
+            },
+        )
+
+    def ensure_sequence(self, key: str, seed: int = 0) -> int:
+        return int(
+            self.ensure_sequence_script(keys=[key, self.sequence_key(key)], args=[seed])
+        )
+
+    def mark_read(self, key: str, seq: int, name: str) -> int:
+        return int(
+            self.mark_read_script(
+                keys=[self.read_key(key), self.sequence_key(key), READ_DIRTY_KEY],
+                args=[seq, name],
+            )
+        )
+
+    @staticmethod
+    def sequence_key(key: str) -> str:
+        return f"{key}:seq"
+
+    @staticmethod
+    def message_id_key(key: str, client_msg_id: str) -> str:
+        return f"{key}:msg_id:{client_msg_id}"
+
+    @staticmethod
+    def page_key(key: str) -> str:
+        return f"{key}:page"
+
+    @staticmethod
+    def read_key(key: str) -> str:
+        return f"{key}:read"
+
+    @staticmethod
+    def encode_page_item(message: dict) -> bytes:
+        """
+        json of a message as it appears in a history page, without seq and client_msg_id
+        """
+        return json.dumps(
+            {
+                "type": message["type"],
+                "message": message["message"],
+                "is_host": message["is_host"],
+                "datetime": message["datetime"],
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+    @staticmethod
+    def encode_member(frame: ChatFrame, version: int = MEMBER_VERSION_COMPACT) -> bytes:
+        # the timestamp stays in the member: scores are doubles and cannot hold
+        # 17 digits exactly, and it keeps identical texts sent at different times distinct
+        fields = [
+            MEMBER_TYPE_CODES[frame.type],
+            frame.is_host,
+            frame.message,
+            frame.score,
+        ]
+        if version == MEMBER_VERSION_SEQUENCED:
+            # array of 5, the seq element is appended by APPEND_MESSAGE_LUA
+            return bytes((version, 0x95)) + b"".join(map(msgpack.packb, fields))
+        return bytes((version,)) + msgpack.packb(fields)
+
+    @staticmethod
+    def decode_member(member: bytes, score: Optional[float] = None) -> dict:
+        if member[0] in (MEMBER_VERSION_COMPACT, MEMBER_VERSION_SEQUENCED):
+            type_code, is_host, message, timestamp, *seq = msgpack.unpackb(member[1:])
+            t = str(timestamp)
+            decoded = {
+                "type": MEMBER_TYPES[type_code],
+                "message": message,
+                "is_host": is_host,
+                "datetime": f"{t[:4]}-{t[4:6]}-{t[6:8]}T{t[8:10]}:{t[10:12]}:{t[12:14]}.{t[14:]}",
+            }
+            if seq:
+                decoded["seq"] = seq[0]
+                return decoded
+        else:
+            # legacy json member
+            decoded = dict(json.loads(member.decode("utf-8")))
+
+        if score is not None and score < LEGACY_SCORE_THRESHOLD:
+            decoded["seq"] = int(score)
+        return decoded
 
     def empty_sorted_set(self, key: str) -> None:
         self.redis_conn.zremrangebyrank(key, 0, -1)
@@ -63,18 +312,13 @@ class RedisService:
             return datetime.now().strftime("%Y%m%d%H%M%S%f")[:-3]
         else:
             try:
-                datetime.strptime(datetime_str, "%Y-%m-%dT%H:%M:%S.%f")
-            except ValueError:
+                _, score = parse_frame_datetime(datetime_str)
+            except InvalidInputException:
                 raise ValueError(
                     "Incorrect data format, should be YYYY-MM-DDTHH:MM:SS.s"
                 )
 
-            return (
-                datetime_str.replace("-", "")
-                .replace("T", "")
-                .replace(":", "")
-                .replace(".", "")
-            )
+            return str(score)
 
 
 class ChatroomService(object):
@@ -92,6 +336,75 @@ class ChatroomService(object):
         s = shortuuid.encode(u)
         return s
 
+    @staticmethod
+    def reserve_client_chatroom(host_id: int) -> Chatroom:
+        """
+        new chatroom of the host with a random guest nickname, not saved yet.
+        the row is only inserted with the first guest message, see materialize_chatroom
+        """
+        # django channels group name only accepts ASCII alphanumeric, hyphens, underscores, or periods
+        # max length 100
+        return Chatroom(
+            host_id=host_id,
+            guest=generate_random_nickname(),
+            name=ChatroomService.generate_chatroom_uuid(),  # length 22
+        )
+
+    @staticmethod
+    def sign_reservation(chatroom: Chatroom) -> str:
+        return signing.dumps(
+            {"host": chatroom.host_id, "guest": chatroom.guest, "name": chatroom.name},
+            salt=RESERVATION_SALT,
+        )
+
+    @staticmethod
+    def load_reservation(
+        reservation: Optional[str], name: Optional[str] = None
+    ) -> Optional[Chatroom]:
+        """
+        the unsaved chatroom of a signed reservation, None if it is invalid, expired
+        or for another chatroom name
+        """
+        if not reservation:
+            return None
+        try:
+            data = signing.loads(
+                reservation,
+                salt=RESERVATION_SALT,
+                max_age=settings.CHATROOM_RESERVATION_MAX_AGE,
+            )
+        except signing.BadSignature:
+            return None
+        if name is not None and data["name"] != name:
+            return None
+        return Chatroom(host_id=data["host"], guest=data["guest"], name=data["name"])
+
+    @staticmethod
+    def materialize_chatroom(
+        chatroom: Chatroom, frame: ChatFrame
+    ) -> Optional[Chatroom]:
+        """
+        inserts the row of a reserved chatroom with its first message as the latest one.
+        the saved chatroom, None if the name is taken by another host
+        """
+        defaults = dict(
+            host_id=chatroom.host_id,
+            guest=chatroom.guest,
+            latest_msg=frame.message,
+            latest_msg_at=frame.timestamp,
+        )
+        try:
+            saved, _ = Chatroom.objects.get_or_create(
+                name=chatroom.name, defaults=defaults
+            )
+        except IntegrityError:
+            # inserted by another connection of the same guest in between
+            saved = Chatroom.objects.get(name=chatroom.name)
+
+        if saved.host_id != chatroom.host_id:
+            return None
+        return saved
+
     def get_file_text(self) -> str:
         msg_data = ""
         if self.chatroom.is_closed:
@@ -122,19 +435,19 @@ class ChatroomService(object):
 
         messages = redis_conn.zrange(group_name, 0, -1, withscores=True)
 
-        decoded_messages: List[dict] = []
-
-        for m in messages:
-            json_dict = m[0].decode("utf-8")
-            decoded_messages.append(dict(json.loads(json_dict)))
-        return decoded_messages
+        return [RedisService.decode_member(*m) for m in messages]
 
 
 class ChatConsumerService:
+    PAGE_SIZE = 50
+    # reconnecting clients missing more messages than this get a full page instead
+    RESUME_MAX_GAP = 200
+    # how long a client message id is remembered for retries, in seconds
+    MESSAGE_ID_TTL = 60 * 5
+
     def __init__(
         self, group_name: str, chatroom: Chatroom, redis_conn: Optional[Redis]
     ):
-        self.redis_service = RedisService(redis_conn)
         self.group_name = group_name
         self.chatroom = chatroom
         if redis_conn is None:
@@ -143,72 +456,640 @@ class ChatConsumerService:
             )
         else:
             self.redis_conn = redis_conn
+        self.redis_service = RedisService(self.redis_conn)
 
-    def save_msg_in_mem(self, msg_obj: dict) -> dict:
-        return self.redis_service.save_obj(self.group_name, msg_obj)
+    def save_msg_in_mem(self, msg_obj: dict) -> Tuple[ChatFrame, bool]:
+        """
+        returns the saved frame and whether it is new,
+        False when it is a retry of a message already saved
+        """
+        return self.save_frame_in_mem(validate_chat_frame(msg_obj))
+
+    def save_frame_in_mem(self, frame: ChatFrame) -> Tuple[ChatFrame, bool]:
+        """
+        same as save_msg_in_mem for a frame already validated
+        """
+        return self.redis_service.append_obj(
+            self.group_name, frame, self.MESSAGE_ID_TTL, self.PAGE_SIZE
+        )
+
+    def get_latest_page_raw(self) -> str:
+        """
+        latest messages as a ready to send text frame, same content as get_past_messages.
+        served from the pre-serialized page without decoding or encoding any message
+        """
+        page_key = RedisService.page_key(self.group_name)
+        items = self.redis_conn.lrange(page_key, 0, -1)
+        if not items:
+            items = self._cache_latest_page()
+
+        return (
+            '{"data": ['
+            + b", ".join(items).decode("utf-8")
+            + '], "type": "chat_message"}'
+        )
+
+    def _cache_latest_page(self) -> List[bytes]:
+        """
+        builds the page for rooms written before it existed
+        """
+        page_key = RedisService.page_key(self.group_name)
+        with self.redis_conn.pipeline() as pipe:
+            try:
+                # an append in between would be missing from the page, so give up on it
+                pipe.watch(self.group_name)
+                messages = pipe.zrange(
+                    self.group_name, -self.PAGE_SIZE, -1, withscores=True
+                )
+                items = []
+                for m in messages:
+                    decoded = RedisService.decode_member(*m)
+                    item = RedisService.encode_page_item(decoded)
+                    if "seq" in decoded:
+                        item = item[:-1] + f', "seq": {decoded["seq"]}}}'.encode()
+                    items.append(item)
+
+                if items:
+                    pipe.multi()
+                    pipe.delete(page_key)
+                    pipe.rpush(page_key, *items)
+                    pipe.execute()
+            except WatchError:
+                pass
+        return items
+
+    def ensure_sequence(self) -> int:
+        """
+        makes sure the room has a sequence counter, continuing from the messages in db
+        when its redis state was dropped (closed, idle or evicted rooms).
+        the latest page of those messages is put back, older pages are read from db on request
+        """
+        if self.redis_conn.exists(RedisService.sequence_key(self.group_name)):
+            return 0
+        latest_messages = list(
+            ChatMessage.objects.filter(
+                chatroom_id=self.chatroom.id, seq__isnull=False
+            ).order_by("-seq")[: self.PAGE_SIZE]
+        )
+        if latest_messages and not self.redis_conn.exists(self.group_name):
+            self.redis_service.restore_messages(
+                self.group_name, [self.db_message_to_frame(m) for m in latest_messages]
+            )
+            self.redis_conn.zadd(ACTIVE_KEY, {self.group_name: time.time()}, nx=True)
+
+        latest_seq = latest_messages[0].seq if latest_messages else 0
+        return self.redis_service.ensure_sequence(self.group_name, latest_seq)
+
+    @staticmethod
+    def db_message_to_frame(message: ChatMessage) -> ChatFrame:
+        datetime_str = message.datetime.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        timestamp, score = parse_frame_datetime(datetime_str)
+        return ChatFrame(
+            type="chat_message",
+            message=message.message,
+            is_host=message.is_host,
+            datetime=datetime_str,
+            timestamp=timestamp,
+            score=score,
+            seq=message.seq,
+        )
 
     def get_past_messages(
         self,
         is_ascending: bool = True,
-        starting_point: Optional[str] = None,
+        starting_point: Optional[Union[str, int]] = None,
     ) -> List[dict]:
+        """
+        latest messages before starting_point, which is either a seq (exclusive)
+        or, for older clients, a datetime string
+        """
         if starting_point is None:
-            base_score = RedisService.datetime_str_to_score_format()
+            max_seq = "+inf"
+        elif isinstance(starting_point, int) or starting_point.isdigit():
+            max_seq = f"({int(starting_point)}"
         else:
-            try:
-                base_score = RedisService.datetime_str_to_score_format(starting_point)
-                base_score = str(int(base_score) - 1)
-            except ValueError as e:
-                raise InvalidInputException(str(e))
+            return self._get_messages_before_datetime(starting_point, is_ascending)
 
         messages = self.redis_conn.zrevrangebyscore(
-            self.group_name, base_score, "-inf", withscores=True, start=0, num=50
+            self.group_name,
+            max_seq,
+            "-inf",
+            withscores=True,
+            start=0,
+            num=self.PAGE_SIZE,
         )
+        # zrevrangebyscore 의 아이템은 (value, score) 형태
+        messages = [RedisService.decode_member(*m) for m in messages]
+        if len(messages) < self.PAGE_SIZE and self.chatroom.pk is not None:
+            # redis only holds the latest page of rooms put back from db
+            if messages:
+                before_seq = messages[-1].get("seq")
+            elif starting_point is not None:
+                before_seq = int(starting_point)
+            else:
+                before_seq = None
+            messages.extend(
+                self._get_db_messages_before(before_seq, self.PAGE_SIZE - len(messages))
+            )
+
         if is_ascending:
-            messages = sorted(messages, key=lambda x: x[1])
-        decoded_messages: List[dict] = []
+            messages.reverse()
+        return messages
 
-        for m in messages:
-            json_str = m[0].decode(
-                "utf-8"
-            )  # zrevrangebyscore 의 아이템은 (value, score) 형태이므로 m[0]
-            decoded_messages.append(dict(json.loads(json_str)))
-        return decoded_messages
+    def _get_db_messages_before(
+        self, before_seq: Optional[int], limit: int
+    ) -> List[dict]:
+        queryset = ChatMessage.objects.filter(
+            chatroom_id=self.chatroom.id, seq__isnull=False
+        )
+        if before_seq is not None:
+            queryset = queryset.filter(seq__lt=before_seq)
+        return [
+            self.db_message_to_frame(m).as_dict()
+            for m in queryset.order_by("-seq")[:limit]
+        ]
+
+    def get_missed_messages(self, cursor: int) -> Optional[List[dict]]:
+        """
+        messages after the seq cursor a reconnecting client already has,
+        None if there are too many to resume or redis no longer holds them all
+        """
+        messages = self.redis_conn.zrangebyscore(
+            self.group_name,
+            f"({cursor}",
+            "+inf",
+            withscores=True,
+            start=0,
+            num=self.RESUME_MAX_GAP + 1,
+        )
+        if len(messages) > self.RESUME_MAX_GAP:
+            return None
+        messages = [RedisService.decode_member(*m) for m in messages]
+        # rooms put back from db only hold their latest page in redis
+        if messages and messages[0].get("seq") != cursor + 1:
+            return None
+        return messages
+
+    def _get_messages_before_datetime(
+        self, starting_point: str, is_ascending: bool
+    ) -> List[dict]:
+        try:
+            RedisService.datetime_str_to_score_format(starting_point)
+        except ValueError as e:
+            raise InvalidInputException(str(e))
+
+        # scores are sequence numbers, so walk back from the latest message
+        messages: List[dict] = []
+        start = 0
+        while len(messages) < self.PAGE_SIZE:
+            chunk = self.redis_conn.zrevrange(
+                self.group_name, start, start + self.PAGE_SIZE - 1, withscores=True
+            )
+            if not chunk:
+                break
+            for m in chunk:
+                decoded = RedisService.decode_member(*m)
+                # same fixed width format, so string comparison is chronological
+                if decoded["datetime"] < starting_point:
+                    messages.append(decoded)
+            start += self.PAGE_SIZE
+
+        messages = messages[: self.PAGE_SIZE]
+        if is_ascending:
+            messages.reverse()
+        return messages
 
     def get_latest_message(self) -> Union[None, dict]:
         return self.redis_service.get_latest_obj(self.group_name)
 
     def save_latest_message_db(
         self, latest_msg_obj: dict, is_guest: bool = False
-    ) -> dict:
-        data = dict(
-            latest_msg_at=latest_msg_obj.get("datetime"),
-            latest_msg=latest_msg_obj.get("message"),
+    ) -> None:
+        latest_msg_at, _ = parse_frame_datetime(latest_msg_obj.get("datetime"))
+        Chatroom.objects.update_latest_message(
+            self.chatroom.id,
+            latest_msg_obj.get("message"),
+            latest_msg_at,
+            last_checked_at=None if is_guest else datetime.now(),
+        )
+
+    def mark_read(self, seq: int) -> Optional[int]:
+        """
+        moves the host's read marker forward, None if it was already at or past seq
+        """
+        read_seq = self.redis_service.mark_read(
+            self.group_name, seq, self.chatroom.name
         )
-        if not is_guest:
-            data["last_checked_at"] = datetime.now()
+        return read_seq or None
 
-        serializer = ChatroomSerializer(self.chatroom, data=data, partial=True)
+    def get_read_seq(self) -> Optional[int]:
+        read_seq = self.redis_conn.get(RedisService.read_key(self.group_name))
+        if read_seq is None:
+            return self.chatroom.last_read_seq
+        return int(read_seq)
 
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(updated_at=datetime.now())
+    def save_read_seq_db(self) -> None:
+        # the room stays in the dirty set, a later flush writes the same value again
+        read_seq = self.redis_conn.get(RedisService.read_key(self.group_name))
+        if read_seq is not None:
+            Chatroom.objects.update_last_read_seqs({self.chatroom.name: int(read_seq)})
 
-        return serializer.data
+    def get_mem_keys(self) -> List[str]:
+        # client message id keys are left to expire on their own
+        return [
+            self.group_name,
+            RedisService.sequence_key(self.group_name),
+            RedisService.page_key(self.group_name),
+            RedisService.read_key(self.group_name),
+        ]
 
     def delete_chatroom_messages_mem(self) -> None:
-        self.redis_service.remove_key(self.group_name)
+        with self.redis_conn.pipeline(transaction=False) as pipe:
+            pipe.delete(*self.get_mem_keys())
+            pipe.zrem(ACTIVE_KEY, self.group_name)
+            pipe.execute()
+
+    def save_missing_messages_db(self) -> int:
+        """
+        saves the chat messages in redis that are missing from db, e.g. when a write failed.
+        returns the number of messages saved
+        """
+        members = self.redis_conn.zrange(self.group_name, 0, -1, withscores=True)
+        messages = [
+            m
+            for m in (RedisService.decode_member(*member) for member in members)
+            if m["type"] == "chat_message" and m.get("seq") is not None
+        ]
+        if not messages:
+            return 0
+
+        saved_seqs = set(
+            ChatMessage.objects.filter(
+                chatroom_id=self.chatroom.id, seq__gte=messages[0]["seq"]
+            ).values_list("seq", flat=True)
+        )
+        messages = [m for m in messages if m["seq"] not in saved_seqs]
+        if not messages:
+            return 0
+
+        saved_seqs = self._backfill_legacy_seqs(messages)
+        missing = [
+            ChatMessage(
+                chatroom_id=self.chatroom.id,
+                message=m["message"],
+                is_host=m["is_host"],
+                datetime=parse_frame_datetime(m["datetime"])[0],
+                seq=m["seq"],
+            )
+            for m in messages
+            if m["seq"] not in saved_seqs
+        ]
+        # the sender's save may land in between, the unique seq drops the second write
+        ChatMessage.objects.bulk_create(missing, ignore_conflicts=True)
+        return len(missing)
+
+    def _backfill_legacy_seqs(self, messages: List[dict]) -> Set[int]:
+        """
+        messages of rooms created before seq were saved without one, and got their seq
+        when the room was renumbered in redis. Those rows are matched by datetime, sender
+        and text and given the seq instead of being saved again. returns the seqs matched
+        """
+        # the datetime of a redis member is cut to milliseconds
+        def legacy_key(dt: datetime, is_host: bool, message: str) -> tuple:
+            return (
+                dt.replace(microsecond=dt.microsecond // 1000 * 1000),
+                is_host,
+                message,
+            )
+
+        datetimes = [parse_frame_datetime(m["datetime"])[0] for m in messages]
+        legacy_rows = {}
+        for row in ChatMessage.objects.filter(
+            chatroom_id=self.chatroom.id,
+            seq__isnull=True,
+            datetime__gte=min(datetimes),
+            datetime__lt=max(datetimes) + timedelta(milliseconds=1),
+        ).order_by("id"):
+            legacy_rows.setdefault(
+                legacy_key(row.datetime, row.is_host, row.message), []
+            ).append(row)
+
+        backfilled = []
+        for m, dt in zip(messages, datetimes):
+            rows = legacy_rows.get(legacy_key(dt, m["is_host"], m["message"]))
+            if rows:
+                row = rows.pop(0)
+                row.seq = m["seq"]
+                backfilled.append(row)
+        ChatMessage.objects.bulk_update(backfilled, ["seq"])
+        return {row.seq for row in backfilled}
 
-    def save_chat_message_db(self, msg_obj: dict) -> dict:
-        serializer = ChatMessageSerializer(data=msg_obj)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(chatroom_id=self.chatroom.id)
+    def close_chatroom(
+        self, is_guest: bool = False, idle_before: Optional[float] = None
+    ) -> bool:
+        """
+        saves the latest message, read marker and any message missing from db,
+        then drops the room's redis state and marks it closed.
+        with idle_before (unix time), a room that got a message or a read marker
+        in the meantime is left open. returns whether the room was closed
+        """
+        with self.redis_conn.pipeline() as pipe:
+            try:
+                if idle_before is not None:
+                    pipe.watch(
+                        RedisService.sequence_key(self.group_name),
+                        RedisService.read_key(self.group_name),
+                    )
+                    active_at = pipe.zscore(ACTIVE_KEY, self.group_name)
+                    if active_at is not None and active_at > idle_before:
+                        return False
+
+                latest_message = self.get_latest_message()
+                if latest_message is not None:
+                    self.save_latest_message_db(latest_message, is_guest)
+                self.save_missing_messages_db()
+                self.save_read_seq_db()
+
+                pipe.multi()
+                pipe.delete(*self.get_mem_keys())
+                pipe.zrem(ACTIVE_KEY, self.group_name)
+                pipe.execute()
+            except WatchError:
+                return False
 
-        return serializer.data
+        Chatroom.objects.mark_closed(self.chatroom.id)
+        self.chatroom.is_closed = True
+        return True
+
+    def save_chat_message_db(self, frame: ChatFrame) -> ChatMessage:
+        # already validated by validate_chat_frame, no need to go through a serializer again
+        chat_message = ChatMessage(
+            chatroom_id=self.chatroom.id,
+            message=frame.message,
+            is_host=frame.is_host,
+            datetime=frame.timestamp,
+            seq=frame.seq,
+            client_msg_id=frame.client_msg_id,
+        )
+        # dropped by the unique constraints when a close already saved the same seq,
+        # or when a retry outlived the redis dedupe window
+        ChatMessage.objects.bulk_create([chat_message], ignore_conflicts=True)
+        return chat_message
+
+
+class ReadReceiptService:
+    def __init__(self, redis_conn: Redis):
+        self.redis_conn = redis_conn
+
+    def flush_dirty(self, batch_size: int = 500) -> int:
+        """
+        writes the read markers changed since the last flush to db,
+        one bulk UPDATE per batch of chatrooms. returns the number of chatrooms flushed
+        """
+        flushed = 0
+        while True:
+            # a marker moved after the pop puts its room back in the set for the next flush
+            names = self.redis_conn.spop(READ_DIRTY_KEY, batch_size)
+            if not names:
+                return flushed
+
+            names = [name.decode("utf-8") for name in names]
+            read_seqs = self.redis_conn.mget(
+                [RedisService.read_key(f"chat_{name}") for name in names]
+            )
+            try:
+                Chatroom.objects.update_last_read_seqs(
+                    {
+                        name: int(read_seq)
+                        for name, read_seq in zip(names, read_seqs)
+                        if read_seq is not None
+                    }
+                )
+            except Exception:
+                self.redis_conn.sadd(READ_DIRTY_KEY, *names)
+                raise
+            flushed += len(names)
+
+
+class SweeperService:
+    """
+    reclaims chatrooms nobody wrote in and the redis keys of chatrooms and hosts that are gone
+    """
+
+    CHAT_KEY_PREFIX = "chat_"
+    STATUS_KEY_PREFIX = "status_"
+
+    def __init__(self, redis_conn: Redis):
+        self.redis_conn = redis_conn
+
+    def seed_active_chatrooms(self, batch_size: int = 500) -> int:
+        """
+        adds the chatrooms kept in redis before ACTIVE_KEY existed, as active from now on,
+        so close_idle_chatrooms sees them. returns the number of chatrooms added
+        """
+        seeded = 0
+        now = time.time()
+        group_names = []
+        for key in self.redis_conn.scan_iter(
+            match=f"{self.CHAT_KEY_PREFIX}*", count=batch_size
+        ):
+            # chat_<name> only, not chat_<name>:seq, chat_<name>:page ...
+            if b":" not in key:
+                group_names.append(key)
+            if len(group_names) >= batch_size:
+                seeded += self.redis_conn.zadd(
+                    ACTIVE_KEY, dict.fromkeys(group_names, now), nx=True
+                )
+                group_names = []
+        if group_names:
+            seeded += self.redis_conn.zadd(
+                ACTIVE_KEY, dict.fromkeys(group_names, now), nx=True
+            )
+        return seeded
+
+    def close_idle_chatrooms(self, idle_timeout: int, batch_size: int = 500) -> int:
+        """
+        closes the open chatrooms without a message for idle_timeout seconds,
+        same as a close from the websocket. connected clients get the "closed" notice.
+        returns the number of chatrooms closed
+        """
+        idle_before = time.time() - idle_timeout
+        channel_layer = get_channel_layer()
+        closed = 0
+        start = 0
+        while True:
+            keys = self.redis_conn.zrangebyscore(
+                ACTIVE_KEY, "-inf", idle_before, start=start, num=batch_size
+            )
+            if not keys:
+                return closed
+
+            group_names = [key.decode("utf-8") for key in keys]
+            closed_group_names = []
+            chatrooms = Chatroom.objects.in_bulk(
+                [name[len(self.CHAT_KEY_PREFIX) :] for name in group_names],
+                field_name="name",
+            )
+            for group_name in group_names:
+                chatroom = chatrooms.get(group_name[len(self.CHAT_KEY_PREFIX) :])
+                if chatroom is None or chatroom.is_closed:
+                    # left to expire_orphaned_chat_keys
+                    self.redis_conn.zrem(ACTIVE_KEY, group_name)
+                    continue
+
+                service = ChatConsumerService(group_name, chatroom, self.redis_conn)
+                if not service.close_chatroom(is_guest=True, idle_before=idle_before):
+                    active_at = self.redis_conn.zscore(ACTIVE_KEY, group_name)
+                    if active_at is not None and active_at <= idle_before:
+                        # only its read marker moved, still in the range
+                        start += 1
+                    continue
+
+                closed += 1
+                closed_group_names.append(group_name)
+
+            if channel_layer is not None and closed_group_names:
+                # one event loop per batch, not per chatroom
+                async_to_sync(self.send_closed_notices)(
+                    channel_layer, closed_group_names
+                )
+
+    @staticmethod
+    async def send_closed_notices(channel_layer, group_names: List[str]) -> None:
+        closed_at = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        await asyncio.gather(
+            *(
+                channel_layer.group_send(
+                    group_name,
+                    {
+                        "type": "notice",
+                        "message": "closed",
+                        "is_host": True,
+                        "datetime": closed_at,
+                    },
+                )
+                for group_name in group_names
+            )
+        )
+
+    def delete_empty_chatrooms(
+        self, created_before: datetime, batch_size: int = 500
+    ) -> int:
+        """
+        deletes chatrooms created before created_before without any message, batch_size rows per query.
+        returns the number of chatrooms deleted
+        """
+        empty_chatrooms = Chatroom.objects.filter(
+            created_at__lt=created_before, latest_msg_at__isnull=True
+        ).filter(~Exists(ChatMessage.objects.filter(chatroom_id=OuterRef("id"))))
+
+        deleted = 0
+        last_id = 0
+        while True:
+            chatrooms = list(
+                empty_chatrooms.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "name")[:batch_size]
+            )
+            if not chatrooms:
+                return deleted
+            last_id = chatrooms[-1][0]
+
+            # messages still only in redis, the chatroom is in use
+            with self.redis_conn.pipeline(transaction=False) as pipe:
+                for _, name in chatrooms:
+                    pipe.exists(f"{self.CHAT_KEY_PREFIX}{name}")
+                in_use = pipe.execute()
+
+            ids = [id for (id, _), used in zip(chatrooms, in_use) if not used]
+            if ids:
+                # filtered again, a message may have been saved in between
+                _, deleted_rows = empty_chatrooms.filter(id__in=ids).delete()
+                deleted += deleted_rows.get(Chatroom._meta.label, 0)
+
+    def expire_orphaned_chat_keys(self, ttl: int, batch_size: int = 500) -> int:
+        """
+        expires the keys of chatrooms that are closed or no longer exist
+        """
+        return self._expire_orphaned_keys(
+            self.CHAT_KEY_PREFIX,
+            lambda names: set(
+                Chatroom.objects.filter(name__in=names, is_closed=False).values_list(
+                    "name", flat=True
+                )
+            ),
+            ttl,
+            batch_size,
+        )
+
+    def expire_orphaned_status_keys(self, ttl: int, batch_size: int = 500) -> int:
+        """
+        expires the statuses of hosts that no longer exist, were deleted or turned the online status off
+        """
+        return self._expire_orphaned_keys(
+            self.STATUS_KEY_PREFIX,
+            lambda uuids: set(
+                User.objects.filter(
+                    uuid__in=uuids, is_deleted=False, configs__use_online_status=True
+                ).values_list("uuid", flat=True)
+            ),
+            ttl,
+            batch_size,
+        )
+
+    def _expire_orphaned_keys(
+        self,
+        prefix: str,
+        get_live_names: Callable[[Set[str]], Set[str]],
+        ttl: int,
+        batch_size: int,
+    ) -> int:
+        """
+        walks the keys of prefix with incremental SCAN, one db query per batch_size keys.
+        returns the number of keys given a ttl
+        """
+        expired = 0
+        keys = []
+        for key in self.redis_conn.scan_iter(match=f"{prefix}*", count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                expired += self._expire_orphans(prefix, keys, get_live_names, ttl)
+                keys = []
+        if keys:
+            expired += self._expire_orphans(prefix, keys, get_live_names, ttl)
+        return expired
+
+    def _expire_orphans(
+        self,
+        prefix: str,
+        keys: Iterable[bytes],
+        get_live_names: Callable[[Set[str]], Set[str]],
+        ttl: int,
+    ) -> int:
+        # chat_<name>, chat_<name>:seq, chat_<name>:page ...
+        names = {
+            key: key.decode("utf-8").split(":", 1)[0][len(prefix) :] for key in keys
+        }
+        live_names = get_live_names(set(names.values()))
+        orphans = [key for key, name in names.items() if name not in live_names]
+        if not orphans:
+            return 0
+
+        with self.redis_conn.pipeline(transaction=False) as pipe:
+            for key in orphans:
+                pipe.ttl(key)
+            ttls = pipe.execute()
+
+            # keys already expiring are left as they are
+            orphans = [key for key, key_ttl in zip(orphans, ttls) if key_ttl == -1]
+            for key in orphans:
+                pipe.expire(key, ttl)
+            pipe.execute()
+        return len(orphans)
 
 
 class StatusConsumerService:
     def __init__(self, group_name: str, redis_conn: Optional[Redis]):
-        self.redis_service = RedisService(redis_conn)
         self.group_name = group_name
         if redis_conn is None:
             self.redis_conn = redis.StrictRedis(
@@ -216,13 +1097,25 @@ class StatusConsumerService:
             )
         else:
             self.redis_conn = redis_conn
+        self.redis_service = RedisService(self.redis_conn)
 
     def get_latest_status(self) -> Union[None, dict]:
         return self.redis_service.get_latest_obj(self.group_name)
 
+    def get_host_status(self) -> Optional[str]:
+        """
+        "online" or "offline" from the host's latest status, None if the host never connected
+        """
+        latest_status = self.get_latest_status()
+        if latest_status is None or not latest_status.get("is_host"):
+            return None
+        return latest_status["message"]
+
     def update_status_in_mem(self, msg_obj: dict) -> dict:
         self.redis_service.empty_sorted_set(self.group_name)
-        return self.redis_service.save_obj(self.group_name, msg_obj)
+        return self.redis_service.save_obj(
+            self.group_name, validate_chat_frame(msg_obj)
+        ).as_dict()
 
     def delete_status_room_mem(self) -> None:
         self.redis_service.remove_key(self.group_name)
@@ -1,3 +1,736 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from apps.chat.consumers.chat_consumer import ChatConsumer
+from apps.chat.models import Chatroom, ChatMessage
+from apps.chat.services import (
+    ACTIVE_KEY,
+    ChatConsumerService,
+    ChatroomService,
+    RedisService,
+    SweeperService,
+)
+from apps.chat.validators import validate_chat_frame
+from apps.user.models import User
+from config.channel_layers import HybridRedisChannelLayer
+from config.exceptions import InvalidInputException
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
+}
+
+
+def get_redis_conn() -> redis.StrictRedis:
+    return redis.StrictRedis(host=os.environ.get("REDIS_HOST"), port=6379, db=0)
+
+
+def create_host(name: str) -> User:
+    return User.objects.create_user(
+        email=f"{name}@pintalk.app",
+        password="password",
+        uuid=f"{name}uuid",
+        access_key=f"{name}access",
+        secret_key=f"{name}secret",
+        service_name="pintalk",
+        service_expl="pintalk",
+        service_domain="pintalk.app",
+    )
+
+
+def delete_chatroom_mem(redis_conn: redis.StrictRedis, group_name: str) -> None:
+    keys = list(redis_conn.scan_iter(match=f"{group_name}*"))
+    if keys:
+        redis_conn.delete(*keys)
+    redis_conn.zrem(ACTIVE_KEY, group_name)
+
+
+def chat_message_frame(message: str, **kwargs) -> dict:
+    return {
+        "type": "chat_message",
+        "message": message,
+        "is_host": False,
+        "datetime": "2023-01-02T12:00:00.000",
+        **kwargs,
+    }
+
+
+def guest_communicator(room_name: str, query: str = "") -> WebsocketCommunicator:
+    communicator = WebsocketCommunicator(
+        ChatConsumer.as_asgi(),
+        f"/ws/chat/{room_name}/?{query}",
+        headers=[(b"origin", b"https://pintalk.app")],
+    )
+    communicator.scope["user"] = AnonymousUser()
+    communicator.scope["url_route"] = {"kwargs": {"room_name": room_name}}
+    return communicator
+
+
+class LegacyChatroomCloseTest(TestCase):
+    """
+    rooms created before seq keep their messages in db without one,
+    closing them must not save the renumbered redis messages again
+    """
+
+    def setUp(self):
+        self.redis_conn = get_redis_conn()
+        host = create_host("legacy")
+        self.chatroom = Chatroom.objects.create(
+            host=host, guest="guest", name="legacychatroomtest"
+        )
+        self.group_name = f"chat_{self.chatroom.name}"
+        self.service = ChatConsumerService(
+            self.group_name, self.chatroom, self.redis_conn
+        )
+        self.redis_conn.delete(*self.service.get_mem_keys())
+
+        # saved by the former consumer: a db row per message and a redis member scored by datetime
+        for i, message in enumerate(["hello", "hi", "how are you"]):
+            sent_at = datetime(2023, 1, 1, 12, 0, i, 123000)
+            ChatMessage.objects.create(
+                chatroom=self.chatroom,
+                message=message,
+                is_host=i % 2 == 1,
+                datetime=sent_at,
+            )
+            datetime_str = sent_at.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+            member = {
+                "type": "chat_message",
+                "message": message,
+                "is_host": i % 2 == 1,
+                "datetime": datetime_str,
+            }
+            self.redis_conn.zadd(
+                self.group_name,
+                {json.dumps(member): int(sent_at.strftime("%Y%m%d%H%M%S%f")[:-3])},
+            )
+
+    def tearDown(self):
+        self.redis_conn.delete(*self.service.get_mem_keys())
+
+    def test_close_twice_keeps_messages_once(self):
+        self.service.ensure_sequence()
+        self.assertTrue(self.service.close_chatroom())
+        self.assertEqual(
+            list(
+                ChatMessage.objects.filter(chatroom=self.chatroom)
+                .order_by("id")
+                .values_list("seq", flat=True)
+            ),
+            [1, 2, 3],
+        )
+
+        self.service.ensure_sequence()
+        frame, _ = self.service.save_msg_in_mem(
+            {
+                "type": "chat_message",
+                "message": "back again",
+                "is_host": False,
+                "datetime": "2023-01-02T12:00:00.000",
+            }
+        )
+        self.service.save_chat_message_db(frame)
+        self.assertTrue(self.service.close_chatroom())
+
+        self.assertEqual(ChatMessage.objects.filter(chatroom=self.chatroom).count(), 4)
+        self.assertEqual(frame.seq, 4)
+
+
+class ChatroomCloseRaceTest(TestCase):
+    """
+    a close saves the redis messages missing from db while the sender's save may still be queued
+    """
+
+    def setUp(self):
+        self.redis_conn = get_redis_conn()
+        host = create_host("race")
+        self.chatroom = Chatroom.objects.create(
+            host=host, guest="guest", name="closeracetest"
+        )
+        self.service = ChatConsumerService(
+            f"chat_{self.chatroom.name}", self.chatroom, self.redis_conn
+        )
+        self.redis_conn.delete(*self.service.get_mem_keys())
+        self.service.ensure_sequence()
+
+    def tearDown(self):
+        self.redis_conn.delete(*self.service.get_mem_keys())
+
+    def save_msg_in_mem(self, message: str):
+        frame, _ = self.service.save_msg_in_mem(
+            {
+                "type": "chat_message",
+                "message": message,
+                "is_host": False,
+                "datetime": "2023-01-02T12:00:00.000",
+            }
+        )
+        return frame
+
+    def test_save_landing_during_close(self):
+        self.service.save_chat_message_db(self.save_msg_in_mem("first"))
+        in_flight = self.save_msg_in_mem("second")
+
+        # the queued save lands after the close read which seqs db already has
+        backfill = self.service._backfill_legacy_seqs
+
+        def save_then_backfill(messages):
+            self.service.save_chat_message_db(in_flight)
+            return backfill(messages)
+
+        with mock.patch.object(
+            self.service, "_backfill_legacy_seqs", side_effect=save_then_backfill
+        ):
+            self.assertTrue(self.service.close_chatroom())
+
+        self.assertEqual(
+            list(
+                ChatMessage.objects.filter(chatroom=self.chatroom)
+                .order_by("seq")
+                .values_list("seq", flat=True)
+            ),
+            [1, 2],
+        )
+
+    def test_save_landing_after_close(self):
+        in_flight = self.save_msg_in_mem("first")
+        self.assertTrue(self.service.close_chatroom())
+        self.service.save_chat_message_db(in_flight)
+
+        self.assertEqual(ChatMessage.objects.filter(chatroom=self.chatroom).count(), 1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ReservedChatroomTest(TransactionTestCase):
+    """
+    a reserved chatroom is saved with the guest's first message
+    """
+
+    def setUp(self):
+        self.redis_conn = get_redis_conn()
+        self.host = create_host("reserving")
+        self.chatroom = ChatroomService.reserve_client_chatroom(self.host.id)
+        self.group_name = f"chat_{self.chatroom.name}"
+        self.reservation = ChatroomService.sign_reservation(self.chatroom)
+
+    def tearDown(self):
+        delete_chatroom_mem(self.redis_conn, self.group_name)
+
+    async def connect(self) -> WebsocketCommunicator:
+        communicator = guest_communicator(
+            self.chatroom.name, f"reservation={self.reservation}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        # the latest page, empty
+        await communicator.receive_from()
+        return communicator
+
+    async def test_first_message_saves_chatroom(self):
+        communicator = await self.connect()
+        await communicator.send_json_to(
+            {
+                "type": "chat_message",
+                "message": "hello",
+                "is_host": False,
+                "datetime": "2023-01-02T12:00:00.000",
+            }
+        )
+        message = await communicator.receive_json_from()
+        await asyncio.sleep(0.1)
+        await communicator.disconnect()
+
+        self.assertEqual(message["seq"], 1)
+        chatroom = await Chatroom.objects.aget(name=self.chatroom.name)
+        self.assertEqual(chatroom.host_id, self.host.id)
+        self.assertEqual(chatroom.latest_msg, "hello")
+        self.assertEqual(
+            await ChatMessage.objects.filter(chatroom=chatroom).acount(), 1
+        )
+
+    async def test_name_taken_by_another_host_leaves_no_trace(self):
+        communicator = await self.connect()
+        other_host = await User.objects.acreate(
+            email="other@pintalk.app", uuid="otheruuid", access_key="otheraccess"
+        )
+        await Chatroom.objects.acreate(
+            host=other_host, guest="someone", name=self.chatroom.name
+        )
+
+        await communicator.send_json_to(
+            {
+                "type": "chat_message",
+                "message": "hello",
+                "is_host": False,
+                "datetime": "2023-01-02T12:00:00.000",
+            }
+        )
+        output = await communicator.receive_output()
+        await communicator.wait()
+
+        self.assertEqual(output, {"type": "websocket.close", "code": 4004})
+        self.assertEqual(list(self.redis_conn.scan_iter(f"{self.group_name}*")), [])
+        self.assertIsNone(self.redis_conn.zscore(ACTIVE_KEY, self.group_name))
+
+
+class AppendMessageTest(TestCase):
+    """
+    messages are appended to redis by a lua script giving them their seq
+    """
+
+    def setUp(self):
+        self.redis_conn = get_redis_conn()
+        self.chatroom = Chatroom.objects.create(
+            host=create_host("append"), guest="guest", name="appendtest"
+        )
+        self.group_name = f"chat_{self.chatroom.name}"
+        self.service = ChatConsumerService(
+            self.group_name, self.chatroom, self.redis_conn
+        )
+        delete_chatroom_mem(self.redis_conn, self.group_name)
+
+    def tearDown(self):
+        delete_chatroom_mem(self.redis_conn, self.group_name)
+
+    def test_seq_follows_append_order(self):
+        frames = [
+            self.service.save_msg_in_mem(chat_message_frame(message))[0]
+            for message in ("one", "two", "three")
+        ]
+
+        self.assertEqual([frame.seq for frame in frames], [1, 2, 3])
+        self.assertEqual(
+            [m["seq"] for m in self.service.get_past_messages()], [1, 2, 3]
+        )
+
+    def test_append_marks_chatroom_active(self):
+        self.service.save_msg_in_mem(chat_message_frame("hello"))
+
+        self.assertIsNotNone(self.redis_conn.zscore(ACTIVE_KEY, self.group_name))
+
+    def test_retry_returns_saved_message(self):
+        frame, is_new = self.service.save_msg_in_mem(
+            chat_message_frame("hello", client_msg_id="retried")
+        )
+        retry, retry_is_new = self.service.save_msg_in_mem(
+            chat_message_frame("hello", client_msg_id="retried")
+        )
+
+        self.assertTrue(is_new)
+        self.assertFalse(retry_is_new)
+        self.assertEqual(retry.seq, frame.seq)
+        self.assertEqual(self.redis_conn.zcard(self.group_name), 1)
+
+    def test_client_msg_id_expires_on_its_own(self):
+        self.service.save_msg_in_mem(chat_message_frame("first", client_msg_id="a"))
+        id_key = RedisService.message_id_key(self.group_name, "a")
+        self.redis_conn.expire(id_key, 10)
+        self.service.save_msg_in_mem(chat_message_frame("second", client_msg_id="b"))
+
+        # a later message does not push back the expiry of earlier ids
+        self.assertLessEqual(self.redis_conn.ttl(id_key), 10)
+        self.assertGreater(
+            self.redis_conn.ttl(RedisService.message_id_key(self.group_name, "b")),
+            10,
+        )
+
+
+class MissedMessagesTest(TestCase):
+    """
+    reconnecting clients only get the messages after their cursor
+    """
+
+    def setUp(self):
+        self.redis_conn = get_redis_conn()
+        self.chatroom = Chatroom.objects.create(
+            host=create_host("missed"), guest="guest", name="missedtest"
+        )
+        self.group_name = f"chat_{self.chatroom.name}"
+        self.service = ChatConsumerService(
+            self.group_name, self.chatroom, self.redis_conn
+        )
+        delete_chatroom_mem(self.redis_conn, self.group_name)
+
+    def tearDown(self):
+        delete_chatroom_mem(self.redis_conn, self.group_name)
+
+    def save_messages(self, count: int) -> None:
+        for i in range(count):
+            self.service.save_msg_in_mem(chat_message_frame(f"message {i}"))
+
+    def test_messages_after_cursor(self):
+        self.save_messages(5)
+
+        missed = self.service.get_missed_messages(2)
+
+        self.assertEqual([m["seq"] for m in missed], [3, 4, 5])
+
+    def test_nothing_missed(self):
+        self.save_messages(3)
+
+        self.assertEqual(self.service.get_missed_messages(3), [])
+
+    def test_too_many_missed(self):
+        self.save_messages(5)
+        self.service.RESUME_MAX_GAP = 3
+
+        self.assertIsNone(self.service.get_missed_messages(1))
+        self.assertEqual(len(self.service.get_missed_messages(2)), 3)
+
+    def test_cursor_before_messages_restored_from_db(self):
+        ChatMessage.objects.bulk_create(
+            ChatMessage(
+                chatroom=self.chatroom,
+                message=f"message {seq}",
+                is_host=False,
+                datetime=datetime(2023, 1, 1) + timedelta(seconds=seq),
+                seq=seq,
+            )
+            for seq in range(1, 121)
+        )
+        self.service.ensure_sequence()
+
+        self.assertIsNone(self.service.get_missed_messages(30))
+        self.assertEqual(
+            [m["seq"] for m in self.service.get_missed_messages(110)],
+            list(range(111, 121)),
+        )
+
+
+class GuestSocketTestCase(TransactionTestCase):
+    """
+    a guest connected to a saved chatroom, frames are sent to it through the channel layer
+    """
+
+    room_name = "sockettest"
+
+    def setUp(self):
+        self.redis_conn = get_redis_conn()
+        self.group_name = f"chat_{self.room_name}"
+        delete_chatroom_mem(self.redis_conn, self.group_name)
+        Chatroom.objects.create(
+            host=create_host("socket"), guest="guest", name=self.room_name
+        )
+
+    def tearDown(self):
+        delete_chatroom_mem(self.redis_conn, self.group_name)
+
+    async def connect(self, query: str = "") -> WebsocketCommunicator:
+        communicator = guest_communicator(self.room_name, query)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def group_send(self, *events: dict) -> None:
+        channel_layer = get_channel_layer()
+        for event in events:
+            await channel_layer.group_send(self.group_name, event)
+
+    @staticmethod
+    async def drain(communicator: WebsocketCommunicator) -> list:
+        # receive_output cancels the consumer when it times out
+        await asyncio.sleep(0.2)
+        outputs = []
+        while not communicator.output_queue.empty():
+            outputs.append(communicator.output_queue.get_nowait())
+        return outputs
+
+    @staticmethod
+    def messages(outputs: list) -> list:
+        return [
+            json.loads(output["text"]).get("message")
+            for output in outputs
+            if output["type"] == "websocket.send"
+        ]
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class InboundLimitsTest(GuestSocketTestCase):
+    async def test_frame_too_large(self):
+        communicator = await self.connect()
+        await self.drain(communicator)
+
+        await communicator.send_to(text_data=json.dumps(chat_message_frame("a" * 5000)))
+
+        self.assertEqual(
+            await self.drain(communicator), [{"type": "websocket.close", "code": 4013}]
+        )
+
+    async def test_frame_rate_exceeded(self):
+        communicator = await self.connect()
+        await self.drain(communicator)
+
+        for _ in range(11):
+            await communicator.send_json_to({"type": "ping"})
+
+        self.assertEqual(
+            await self.drain(communicator), [{"type": "websocket.close", "code": 4029}]
+        )
+
+    async def test_typing_over_the_rate_is_held_back(self):
+        communicator = await self.connect()
+        await self.drain(communicator)
+
+        for i in range(30):
+            await communicator.send_json_to({"type": "typing", "is_typing": i % 2 == 0})
+
+        self.assertEqual(await self.drain(communicator), [])
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class OutboundQueueTest(GuestSocketTestCase):
+    """
+    with ?ack=1 at most ACK_WINDOW frames are in flight, the rest waits in a queue
+    of MAX_QUEUED_FRAMES handled by the outbound policy
+    """
+
+    def outbound(self, policy: str) -> dict:
+        return {
+            "MAX_QUEUED_FRAMES": 3,
+            "POLICY": policy,
+            "BATCH_WINDOW": 0.02,
+            "ACK_WINDOW": 2,
+        }
+
+    async def test_ack_window(self):
+        with self.settings(CHAT_SOCKET_OUTBOUND=self.outbound("close")):
+            communicator = await self.connect("ack=1")
+            await self.group_send(
+                {"type": "chat_message", "message": "0"},
+                {"type": "chat_message", "message": "1"},
+            )
+            # the latest page and one message fill the window
+            self.assertEqual(self.messages(await self.drain(communicator)), [None, "0"])
+
+            await communicator.send_json_to({"type": "ack", "count": 2})
+            self.assertEqual(self.messages(await self.drain(communicator)), ["1"])
+            await communicator.disconnect()
+
+    async def test_ack_past_sent_frames(self):
+        with self.settings(CHAT_SOCKET_OUTBOUND=self.outbound("close")):
+            communicator = await self.connect("ack=1")
+            await self.drain(communicator)
+
+            await communicator.send_json_to({"type": "ack", "count": 5})
+
+            self.assertEqual(
+                await self.drain(communicator),
+                [{"type": "websocket.close", "code": 4000}],
+            )
+
+    async def test_close_policy(self):
+        with self.settings(CHAT_SOCKET_OUTBOUND=self.outbound("close")):
+            communicator = await self.connect("ack=1")
+            await self.group_send(
+                *({"type": "chat_message", "message": str(i)} for i in range(10))
+            )
+
+            outputs = await self.drain(communicator)
+
+            self.assertEqual(self.messages(outputs), [None, "0"])
+            self.assertEqual(outputs[-1], {"type": "websocket.close", "code": 4008})
+
+    async def test_drop_oldest_policy(self):
+        with self.settings(CHAT_SOCKET_OUTBOUND=self.outbound("drop_oldest")):
+            communicator = await self.connect("ack=1")
+            await self.group_send(
+                *({"type": "chat_message", "message": str(i)} for i in range(10))
+            )
+            messages = self.messages(await self.drain(communicator))
+            await communicator.send_json_to({"type": "ack", "count": 2})
+            messages += self.messages(await self.drain(communicator))
+            await communicator.send_json_to({"type": "ack", "count": 4})
+            messages += self.messages(await self.drain(communicator))
+
+            self.assertEqual(messages, [None, "0", "7", "8", "9"])
+            await communicator.disconnect()
+
+    async def test_coalesce_policy(self):
+        with self.settings(CHAT_SOCKET_OUTBOUND=self.outbound("coalesce")):
+            communicator = await self.connect("ack=1")
+            await self.group_send(
+                {"type": "chat_message", "message": "0"},
+                {"type": "chat_message", "message": "1"},
+                {"type": "typing", "is_host": True, "is_typing": True},
+                {"type": "typing", "is_host": True, "is_typing": False},
+            )
+            await self.drain(communicator)
+            await communicator.send_json_to({"type": "ack", "count": 2})
+            outputs = await self.drain(communicator)
+
+            self.assertEqual(
+                [json.loads(output["text"]) for output in outputs],
+                [
+                    {"type": "chat_message", "message": "1"},
+                    {"type": "typing", "is_host": True, "is_typing": False},
+                ],
+            )
+            await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class SweeperTest(TestCase):
+    def setUp(self):
+        self.redis_conn = get_redis_conn()
+        self.host = create_host("sweeper")
+        self.sweeper = SweeperService(self.redis_conn)
+        self.group_names = []
+
+    def tearDown(self):
+        for group_name in self.group_names:
+            delete_chatroom_mem(self.redis_conn, group_name)
+
+    def create_chatroom(self, name: str) -> ChatConsumerService:
+        chatroom = Chatroom.objects.create(host=self.host, guest="guest", name=name)
+        group_name = f"chat_{name}"
+        self.group_names.append(group_name)
+        delete_chatroom_mem(self.redis_conn, group_name)
+        return ChatConsumerService(group_name, chatroom, self.redis_conn)
+
+    def test_close_idle_chatrooms(self):
+        idle = self.create_chatroom("idlesweep")
+        idle.save_msg_in_mem(chat_message_frame("hello"))
+        self.redis_conn.zadd(ACTIVE_KEY, {idle.group_name: time.time() - 120})
+        active = self.create_chatroom("activesweep")
+        active.save_msg_in_mem(chat_message_frame("hello"))
+
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(idle.group_name, channel_name)
+
+        self.assertEqual(self.sweeper.close_idle_chatrooms(60), 1)
+
+        self.assertTrue(Chatroom.objects.get(name="idlesweep").is_closed)
+        self.assertEqual(ChatMessage.objects.filter(chatroom=idle.chatroom).count(), 1)
+        self.assertFalse(self.redis_conn.exists(idle.group_name))
+        self.assertIsNone(self.redis_conn.zscore(ACTIVE_KEY, idle.group_name))
+        notice = async_to_sync(channel_layer.receive)(channel_name)
+        self.assertEqual((notice["type"], notice["message"]), ("notice", "closed"))
+
+        self.assertFalse(Chatroom.objects.get(name="activesweep").is_closed)
+        self.assertTrue(self.redis_conn.exists(active.group_name))
+
+    def test_closed_notices_sent_together(self):
+        channel_layer = get_channel_layer()
+        channel_names = []
+        for i in range(3):
+            idle = self.create_chatroom(f"idlesweep{i}")
+            idle.save_msg_in_mem(chat_message_frame("hello"))
+            self.redis_conn.zadd(ACTIVE_KEY, {idle.group_name: time.time() - 120})
+            channel_name = async_to_sync(channel_layer.new_channel)()
+            async_to_sync(channel_layer.group_add)(idle.group_name, channel_name)
+            channel_names.append(channel_name)
+
+        with mock.patch(
+            "apps.chat.services.async_to_sync", wraps=async_to_sync
+        ) as sync_calls:
+            self.assertEqual(self.sweeper.close_idle_chatrooms(60), 3)
+
+        self.assertEqual(sync_calls.call_count, 1)
+        for channel_name in channel_names:
+            notice = async_to_sync(channel_layer.receive)(channel_name)
+            self.assertEqual(notice["message"], "closed")
+
+    def test_delete_empty_chatrooms(self):
+        self.create_chatroom("emptysweep")
+        self.create_chatroom("unsavedsweep").save_msg_in_mem(
+            chat_message_frame("only in redis")
+        )
+        saved = self.create_chatroom("savedsweep")
+        ChatMessage.objects.create(
+            chatroom=saved.chatroom,
+            message="hi",
+            is_host=False,
+            datetime=datetime.now(),
+        )
+        Chatroom.objects.update(created_at=datetime.now() - timedelta(days=2))
+        self.create_chatroom("newsweep")
+
+        deleted = self.sweeper.delete_empty_chatrooms(
+            datetime.now() - timedelta(days=1), batch_size=1
+        )
+
+        self.assertEqual(deleted, 1)
+        self.assertEqual(
+            set(Chatroom.objects.values_list("name", flat=True)),
+            {"unsavedsweep", "savedsweep", "newsweep"},
+        )
+
+
+class ChatFrameValidationTest(SimpleTestCase):
+    def test_datetime_fraction_digits(self):
+        for datetime_str, expected, score in (
+            ("2023-01-02T12:00:00.123", "2023-01-02T12:00:00.123", 20230102120000123),
+            ("2023-01-02T12:00:00.5", "2023-01-02T12:00:00.500", 20230102120000500),
+            (
+                "2023-01-02T12:00:00.123456",
+                "2023-01-02T12:00:00.123",
+                20230102120000123,
+            ),
+        ):
+            with self.subTest(datetime_str):
+                frame = validate_chat_frame(
+                    chat_message_frame("hello", datetime=datetime_str)
+                )
+                self.assertEqual(frame.datetime, expected)
+                self.assertEqual(frame.score, score)
+                self.assertEqual(
+                    frame.timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3], expected
+                )
+
+    def test_invalid_datetime(self):
+        for datetime_str in (
+            "2023-01-02T12:00:00",
+            "2023-01-02T12:00:00.1234567",
+            "2023-01-02T12:00:00.\u0661\u0662\u0663",
+            "2023-02-30T12:00:00.000",
+        ):
+            with self.subTest(datetime_str):
+                with self.assertRaises(InvalidInputException):
+                    validate_chat_frame(
+                        chat_message_frame("hello", datetime=datetime_str)
+                    )
+
+
+class HybridChannelLayerTest(SimpleTestCase):
+    async def test_local_members_get_their_own_copy(self):
+        channel_layer = HybridRedisChannelLayer(
+            hosts=[(os.environ.get("REDIS_HOST"), 6379)]
+        )
+        channel_names = [await channel_layer.new_channel() for _ in range(2)]
+        for channel_name in channel_names:
+            await channel_layer.group_add("copytest", channel_name)
+        message = {"type": "chat_message", "data": [{"message": "hello"}]}
+
+        try:
+            await channel_layer.group_send("copytest", message)
+            first, second = [
+                await channel_layer.receive(channel_name)
+                for channel_name in channel_names
+            ]
+            first["data"][0]["message"] = "changed"
+
+            self.assertEqual(second["data"], [{"message": "hello"}])
+            self.assertEqual(message["data"], [{"message": "hello"}])
+        finally:
+            for channel_name in channel_names:
+                await channel_layer.group_discard("copytest", channel_name)
+            if channel_layer.membership_listener is not None:
+                channel_layer.membership_listener.cancel()
+            await channel_layer.close_pools()
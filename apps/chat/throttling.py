@@ -0,0 +1,50 @@
+import time
+from collections import Counter
+from typing import Dict
+
+
+class TokenBucket:
+    """
+    in-process token bucket, refilled at rate tokens per second up to burst
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def consume(self, tokens: int = 1) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+class RoomBuckets:
+    """
+    token buckets shared by the connections of a room within this process
+    """
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.connections = Counter()
+
+    def acquire(self, room: str, rate: float, burst: int) -> TokenBucket:
+        if room not in self.buckets:
+            self.buckets[room] = TokenBucket(rate, burst)
+        self.connections[room] += 1
+        return self.buckets[room]
+
+    def release(self, room: str) -> None:
+        self.connections[room] -= 1
+        if self.connections[room] <= 0:
+            del self.connections[room]
+            self.buckets.pop(room, None)
+
+
+room_buckets = RoomBuckets()
@@ -3,6 +3,7 @@ from apps.chat import views
 
 urlpatterns = [
     path("", views.ChatroomClientCreateView.as_view(), name="create-chatroom"),
+    path("bootstrap/", views.WidgetBootstrapView.as_view(), name="bootstrap-widget"),
     path("chatrooms/", views.ChatroomListView.as_view(), name="chatroom-list"),
     path(
         "chatrooms/<int:pk>/chat-messages/",
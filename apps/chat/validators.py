@@ -0,0 +1,135 @@
+import re
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+from rest_framework.fields import BooleanField
+
+from config.exceptions import InvalidInputException
+
+FRAME_TYPES = frozenset(["chat_message", "notice", "request", "status"])
+MAX_MESSAGE_LENGTH = 1000
+MAX_CLIENT_MSG_ID_LENGTH = 64
+
+# YYYY-MM-DDTHH:MM:SS.sss, 1 to 6 fraction digits like strptime's %f, kept to milliseconds.
+# [0-9] rather than \d, which also matches non-ASCII digits
+FRAME_DATETIME_RE = re.compile(
+    r"([0-9]{4})-([0-9]{2})-([0-9]{2})T([0-9]{2}):([0-9]{2}):([0-9]{2})\.([0-9]{1,6})"
+)
+DATETIME_FORMAT_ERROR = "Incorrect data format, should be YYYY-MM-DDTHH:MM:SS.sss"
+
+
+class ChatFrame(NamedTuple):
+    """
+    validated websocket frame, carried as is through redis and db persistence
+    """
+
+    type: str
+    message: str
+    is_host: bool
+    datetime: str
+    timestamp: datetime
+    score: int
+    seq: Optional[int] = None
+    client_msg_id: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        data = {
+            "type": self.type,
+            "message": self.message,
+            "is_host": self.is_host,
+            "datetime": self.datetime,
+        }
+        if self.seq is not None:
+            data["seq"] = self.seq
+        if self.client_msg_id is not None:
+            data["client_msg_id"] = self.client_msg_id
+        return data
+
+
+def parse_frame_datetime(value) -> Tuple[datetime, int]:
+    """
+    parses a frame datetime string once, returning the datetime and its sorted set score,
+    both cut to milliseconds
+    """
+    match = FRAME_DATETIME_RE.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        raise InvalidInputException(DATETIME_FORMAT_ERROR)
+
+    year, month, day, hour, minute, second, fraction = match.groups()
+    millisecond = fraction[:3].ljust(3, "0")
+    try:
+        timestamp = datetime(
+            int(year),
+            int(month),
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+            int(millisecond) * 1000,
+        )
+    except ValueError:
+        raise InvalidInputException(DATETIME_FORMAT_ERROR)
+
+    return timestamp, int(year + month + day + hour + minute + second + millisecond)
+
+
+def validate_chat_frame(content) -> ChatFrame:
+    """
+    single pass validation of an inbound frame.
+    accepts the same input as the former in-memory DRF serializer, datetimes
+    with other than 3 fraction digits are given back with milliseconds
+    """
+    if not isinstance(content, dict):
+        raise InvalidInputException("frame should be a json object")
+
+    frame_type = content.get("type")
+    if frame_type not in FRAME_TYPES:
+        raise InvalidInputException(f"invalid frame type '{frame_type}'")
+
+    message = content.get("message")
+    if isinstance(message, (int, float)) and not isinstance(message, bool):
+        message = str(message)
+    if not isinstance(message, str):
+        raise InvalidInputException("message should be a string")
+    message = message.strip()
+    if not 0 < len(message) <= MAX_MESSAGE_LENGTH:
+        raise InvalidInputException(
+            f"message length should be between 1 and {MAX_MESSAGE_LENGTH}"
+        )
+
+    is_host = content.get("is_host")
+    if is_host is not True and is_host is not False:
+        try:
+            if is_host in BooleanField.TRUE_VALUES:
+                is_host = True
+            elif is_host in BooleanField.FALSE_VALUES:
+                is_host = False
+            else:
+                raise InvalidInputException("is_host should be a boolean")
+        except TypeError:  # unhashable
+            raise InvalidInputException("is_host should be a boolean")
+
+    datetime_str = content.get("datetime")
+    timestamp, score = parse_frame_datetime(datetime_str)
+    if len(datetime_str) != 23:
+        datetime_str = timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+
+    # optional, lets a retried message be recognised
+    client_msg_id = content.get("client_msg_id")
+    if client_msg_id is not None and not (
+        isinstance(client_msg_id, str)
+        and 0 < len(client_msg_id) <= MAX_CLIENT_MSG_ID_LENGTH
+    ):
+        raise InvalidInputException(
+            f"client_msg_id should be a string of at most {MAX_CLIENT_MSG_ID_LENGTH} characters"
+        )
+
+    return ChatFrame(
+        frame_type,
+        message,
+        is_host,
+        datetime_str,
+        timestamp,
+        score,
+        client_msg_id=client_msg_id,
+    )
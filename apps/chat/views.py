@@ -6,16 +6,16 @@ from tempfile import NamedTemporaryFile
 from typing import Any
 from urllib.parse import quote
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db.models import QuerySet
-from django.http import Http404, HttpResponse, StreamingHttpResponse
-from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema, no_body
 from rest_framework import generics, status, mixins, permissions
 from rest_framework.exceptions import ValidationError, NotAuthenticated
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -27,15 +27,21 @@ from apps.chat.serializers import (
     ChatMessageSerializer,
     SimpleChatroomSerializer,
 )
-from apps.chat.services import ChatroomService
+from apps.chat.services import (
+    ChatroomService,
+    StatusConsumerService,
+    get_shared_redis,
+)
 from apps.user.models import User
+from apps.user.services import ClientProfileCacheService
+from config.async_views import AsyncAPIViewMixin, AsyncLimitOffsetPagination
 from config.exceptions import (
     InstanceNotFound,
     UnprocessableException,
     InvalidInputException,
 )
-from config.permissions import HostOnly, ClientWithHeadersOnly
-from utils.random_nickname import generate_random_nickname
+from config.permissions import HostOnly, ClientWithHeadersOnly, AuthorizedOriginOnly
+from config.sparse_fields import SparseFieldsMixin
 
 access_key_param = openapi.Parameter(
     "X-PinTalk-Access-Key",
@@ -67,26 +73,31 @@ guest_name_param = openapi.Parameter(
         },
     ),
 )
-class ChatroomListView(generics.ListAPIView):
+class ChatroomListView(SparseFieldsMixin, generics.ListAPIView):
     serializer_class = SimpleChatroomSerializer
     queryset = Chatroom.objects.all()
 
     def get_queryset(self):
-        queryset = self.queryset.filter(host_id=self.request.user.id).order_by(
-            "-updated_at"
-        )
+        # reserved chatrooms have no row until their first message, rooms left empty have no latest message
+        queryset = self.queryset.filter(
+            host_id=self.request.user.id, latest_msg_at__isnull=False
+        ).order_by("-updated_at")
         return queryset
 
 
-class ChatroomClientCreateView(generics.GenericAPIView):
+class ChatroomClientCreateView(AsyncAPIViewMixin, generics.GenericAPIView):
     serializer_class = ChatroomClientSerializer
     queryset = Chatroom.objects.all()
+    # clients are identified by their service keys, not by jwt or session
+    authentication_classes = []
     permission_classes = [permissions.AllowAny, ClientWithHeadersOnly]
 
     @swagger_auto_schema(
         tags=["client"],
         operation_summary="Create chatroom (client side)",
-        operation_description="Make a new chatroom with a random guest nickname and saves the chatroom uuid in cookie",
+        operation_description="Reserve a new chatroom with a random guest nickname. "
+        "The chatroom is saved with the guest's first message, "
+        "until then the websocket connects with the signed reservation (?reservation=)",
         manual_parameters=[access_key_param, secret_key_param],
         request_body=no_body,
         responses={
@@ -95,29 +106,133 @@ class ChatroomClientCreateView(generics.GenericAPIView):
             409: "Chatroom with the provided guest name already exists",
         },
     )
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         access_key = request.headers["X-PinTalk-Access-Key"]
         secret_key = request.headers["X-PinTalk-Secret-Key"]
-        try:
-            host_user = get_object_or_404(
-                User,
-                access_key=access_key,
-                secret_key=secret_key,
-            )
-        except Http404:
+        host_user = (
+            await User.objects.select_related("configs")
+            .filter(access_key=access_key, secret_key=secret_key)
+            .afirst()
+        )
+        if host_user is None:
             raise NotAuthenticated("User not registered")
 
-        guest_name = generate_random_nickname()
+        chatroom = ChatroomService.reserve_client_chatroom(host_user.id)
+        # the host comes with its configs already loaded
+        chatroom.host = host_user
+        data = self.get_serializer(chatroom).data
+        data["reservation"] = ChatroomService.sign_reservation(chatroom)
+        return Response(data, status=status.HTTP_201_CREATED)
 
-        serializer = self.get_serializer(data={"guest": guest_name})
-        if serializer.is_valid(raise_exception=True):
-            # django channels group name only accepts ASCII alphanumeric, hyphens, underscores, or periods
-            # max length 100
-            serializer.save(
-                host_id=host_user.id,
-                name=ChatroomService.generate_chatroom_uuid(),  # length 22
+
+class WidgetBootstrapView(AsyncAPIViewMixin, generics.GenericAPIView):
+    serializer_class = ChatroomClientSerializer
+    queryset = Chatroom.objects.all()
+    # clients are identified by their service keys, not by jwt or session
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny, AuthorizedOriginOnly]
+    # the host is sent once, next to the chatroom
+    chatroom_fields = (
+        "guest",
+        "name",
+        "is_closed",
+        "closed_at",
+        "created_at",
+        "updated_at",
+    )
+
+    @swagger_auto_schema(
+        tags=["client"],
+        operation_summary="Bootstrap the guest widget (client side)",
+        operation_description="Host profile, host online status and the guest's chatroom in one request. "
+        "The chatroom in the guest's cookie (or the reservation or name in the body) is reused while it is open, "
+        "otherwise a new chatroom is reserved. "
+        "Reserved chatrooms are saved with the guest's first message",
+        manual_parameters=[access_key_param, secret_key_param],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                "name": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description="chatroom name saved by the guest, optional",
+                ),
+                "reservation": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description="chatroom reservation saved by the guest, optional",
+                ),
+            },
+        ),
+        responses={
+            200: "Existing chatroom",
+            201: "New chatroom reservation",
+            401: "User not registered",
+            403: "request domain not allowed",
+        },
+    )
+    async def post(self, request, *args, **kwargs):
+        profile = await ClientProfileCacheService.aload(
+            request.headers.get("X-PinTalk-Access-Key", None),
+            request.headers.get("X-PinTalk-Secret-Key", None),
+            self.get_serializer_context(),
+        )
+        if profile is None:
+            raise NotAuthenticated("User not registered")
+        self.check_object_permissions(request, profile)
+
+        cookie = settings.WIDGET_CHATROOM_COOKIE
+        reserved = ChatroomService.load_reservation(
+            request.COOKIES.get(cookie["NAME"]) or request.data.get("reservation")
+        )
+        if reserved is not None and reserved.host_id != profile.user_id:
+            reserved = None
+        room_name = reserved.name if reserved is not None else request.data.get("name")
+
+        chatroom = None
+        if room_name:
+            # saved once the guest sent a message
+            chatroom = await self.queryset.filter(
+                name=room_name, host_id=profile.user_id
+            ).afirst()
+            if chatroom is None:
+                chatroom = reserved
+            elif chatroom.is_closed:
+                chatroom = None
+
+        is_new = chatroom is None
+        if is_new:
+            chatroom = ChatroomService.reserve_client_chatroom(profile.user_id)
+        reservation = ChatroomService.sign_reservation(chatroom)
+
+        host_status = None
+        configs = profile.data.get("configs") or {}
+        if configs.get("use_online_status"):
+            status_service = StatusConsumerService(
+                f"status_{profile.data['uuid']}", get_shared_redis()
             )
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # redis calls are blocking, keep them off the event loop
+            host_status = await sync_to_async(
+                status_service.get_host_status, thread_sensitive=False
+            )()
+
+        serializer = self.get_serializer(chatroom, fields=self.chatroom_fields)
+        response = Response(
+            {
+                "host": profile.data,
+                "chatroom": serializer.data,
+                "reservation": reservation,
+                "host_status": host_status,
+            },
+            status=status.HTTP_201_CREATED if is_new else status.HTTP_200_OK,
+        )
+        response.set_cookie(
+            cookie["NAME"],
+            reservation,
+            max_age=cookie["MAX_AGE"],
+            httponly=True,
+            secure=True,
+            samesite="None",
+        )
+        return response
 
 
 @method_decorator(
@@ -167,10 +282,11 @@ class ChatroomClientResumeView(generics.UpdateAPIView):
         responses={200: openapi.Response("ok", ChatroomClientSerializer)},
     ),
 )
-class ChatroomDetailView(generics.RetrieveDestroyAPIView):
+class ChatroomDetailView(SparseFieldsMixin, generics.RetrieveDestroyAPIView):
     serializer_class = ChatroomClientSerializer
     queryset = Chatroom.objects.all()
     permission_classes = [HostOnly]
+    sparse_required_fields = ("host",)
     allowed_methods = ["GET", "DELETE"]
 
     @swagger_auto_schema(
@@ -218,9 +334,19 @@ class ChatroomExportView(APIView):
         return response
 
 
-@method_decorator(
-    name="get",
-    decorator=swagger_auto_schema(
+class ChatroomMessageView(AsyncAPIViewMixin, SparseFieldsMixin, generics.ListAPIView):
+    queryset = ChatMessage.objects.all()
+    serializer_class = ChatMessageSerializer
+    pagination_class = AsyncLimitOffsetPagination
+
+    def get_queryset(self) -> QuerySet:
+        # chatroom is serialized as its id, no join needed
+        return self.queryset.filter(chatroom_id=self.kwargs.get("pk")).order_by(
+            "-datetime"
+        )
+
+    # method_decorator would wrap the coroutine in a sync function
+    @swagger_auto_schema(
         operation_summary="Get chatroom messages (with pagination)",
         operation_description="DB 에 저장된 메시지 내역을 가져옵니다. 종료된 채팅일 경우에 사용합니다.",
         manual_parameters=[
@@ -243,20 +369,19 @@ class ChatroomExportView(APIView):
                 description="몇 개 가져올 것인지",
             ),
         ],
-    ),
-)
-class ChatroomMessageView(generics.ListAPIView):
-    queryset = ChatMessage.objects.all()
-    serializer_class = ChatMessageSerializer
-    pagination_class = LimitOffsetPagination
+    )
+    async def get(self, request, *args, **kwargs) -> Response:
+        queryset = self.filter_queryset(self.get_queryset())
 
-    def get_queryset(self) -> QuerySet:
-        return (
-            self.queryset.select_related("chatroom")
-            .filter(chatroom_id=self.kwargs.get("pk"))
-            .all()
-            .order_by("-datetime")
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(
+            [message async for message in queryset], many=True
         )
+        return Response(serializer.data)
 
 
 class ChatroomRestoreView(generics.UpdateAPIView):
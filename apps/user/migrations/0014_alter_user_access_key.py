@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0013_alter_userconfiguration_user"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="user",
+            name="access_key",
+            field=models.CharField(db_index=True, max_length=22),
+        ),
+    ]
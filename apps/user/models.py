@@ -91,7 +91,7 @@ class User(AbstractBaseUser, TimeStampMixin, PermissionsMixin, SoftDeleteMixin):
     id = models.BigAutoField(primary_key=True)
     email = models.EmailField(max_length=64, unique=True, null=False)
     uuid = models.CharField(max_length=22, null=False)
-    access_key = models.CharField(max_length=22, null=False, blank=False)
+    access_key = models.CharField(max_length=22, null=False, blank=False, db_index=True)
     secret_key = models.CharField(max_length=64, null=False, blank=False)
     service_name = models.CharField(max_length=50, null=False, blank=False)
     service_domain = models.CharField(max_length=200, null=True, blank=False)
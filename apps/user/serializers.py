@@ -4,9 +4,10 @@ from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 
 from apps.user.models import User, UserConfiguration
+from config.sparse_fields import SparseFieldsSerializerMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     profile_image = serializers.ImageField(required=False, use_url=True)
     password = serializers.CharField(
         write_only=True,
@@ -49,7 +50,9 @@ class UserSerializer(serializers.ModelSerializer):
         return super(UserSerializer, self).create(validated_data)
 
 
-class UserConfigurationSerializer(serializers.ModelSerializer):
+class UserConfigurationSerializer(
+    SparseFieldsSerializerMixin, serializers.ModelSerializer
+):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -65,7 +68,7 @@ class SimpleUserConfigurationSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at", "updated_at", "user"]
 
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     configs = SimpleUserConfigurationSerializer(read_only=True)
 
     class Meta:
@@ -1,14 +1,18 @@
 import datetime
+import hashlib
+import hmac
+import json
 import string
 import uuid
 import base64
 import secrets
 import random
-from typing import Type
+from typing import NamedTuple, Optional, Type
 
 import jwt
 import shortuuid
 from django.conf import settings
+from django.core.cache import cache
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from jwt import InvalidTokenError
@@ -21,6 +25,7 @@ from rest_framework_simplejwt.token_blacklist.models import (
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from apps.user.models import User
+from apps.user.serializers import ClientSerializer
 from config.exceptions import InternalServerError
 
 
@@ -104,3 +109,95 @@ class UserService(object):
             raise InternalServerError()
 
         return outstanding_token.user_id
+
+
+class ClientProfile(NamedTuple):
+    """
+    cached ClientProfileView payload, with what the view checks before serving it
+    """
+
+    user_id: int
+    secret_key_digest: str
+    service_domain: Optional[str]
+    data: dict
+    # digest of data, the base of the response etag
+    version: str
+
+
+class ClientProfileCacheService(object):
+    KEY_PREFIX = "client_profile:"
+
+    @staticmethod
+    def get_key(access_key: str) -> str:
+        return ClientProfileCacheService.KEY_PREFIX + access_key
+
+    @staticmethod
+    def digest_secret_key(secret_key: str) -> str:
+        return hashlib.sha256(secret_key.encode()).hexdigest()
+
+    @staticmethod
+    def make_profile(user: User, data: dict) -> ClientProfile:
+        data = dict(data)
+        version = hashlib.sha1(
+            json.dumps(data, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()[:20]
+        return ClientProfile(
+            user.id,
+            ClientProfileCacheService.digest_secret_key(user.secret_key),
+            user.service_domain,
+            data,
+            version,
+        )
+
+    @staticmethod
+    def matches(profile: ClientProfile, secret_key: Optional[str]) -> bool:
+        return secret_key is not None and hmac.compare_digest(
+            profile.secret_key_digest,
+            ClientProfileCacheService.digest_secret_key(secret_key),
+        )
+
+    @staticmethod
+    async def aget(access_key: str) -> Optional[ClientProfile]:
+        return await cache.aget(ClientProfileCacheService.get_key(access_key))
+
+    @staticmethod
+    async def aset(access_key: str, profile: ClientProfile) -> None:
+        await cache.aset(
+            ClientProfileCacheService.get_key(access_key),
+            profile,
+            settings.CLIENT_PROFILE_CACHE_TIMEOUT,
+        )
+
+    @staticmethod
+    async def aload(
+        access_key: Optional[str], secret_key: Optional[str], serializer_context: dict
+    ) -> Optional[ClientProfile]:
+        """
+        profile of the service keys, serialized from the db and cached on a miss.
+        None when the keys do not match a user
+        """
+        profile = None
+        if access_key is not None:
+            profile = await ClientProfileCacheService.aget(access_key)
+
+        if profile is not None and ClientProfileCacheService.matches(
+            profile, secret_key
+        ):
+            return profile
+
+        user = (
+            await User.objects.select_related("configs")
+            .filter(access_key=access_key, secret_key=secret_key)
+            .afirst()
+        )
+        if user is None:
+            return None
+
+        serializer = ClientSerializer(user, context=serializer_context)
+        profile = ClientProfileCacheService.make_profile(user, serializer.data)
+        await ClientProfileCacheService.aset(access_key, profile)
+        return profile
+
+    @staticmethod
+    def invalidate(access_key: str) -> None:
+        cache.delete(ClientProfileCacheService.get_key(access_key))
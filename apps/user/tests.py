@@ -1,3 +1,111 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.fields import Field
+
+from apps.user.models import User, UserConfiguration
+from apps.user.serializers import ClientSerializer
+from apps.user.services import ClientProfileCacheService
+
+
+class ClientProfileViewTest(TestCase):
+    """
+    the widget profile is served from cache with an ETag, optionally with only some fields
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="client-host@pintalk.app",
+            password="password",
+            uuid="clienthostuuid",
+            access_key="clientaccess",
+            secret_key="clientsecret",
+            service_name="pintalk",
+            service_expl="pintalk",
+            service_domain="pintalk.app",
+            profile_name="host",
+        )
+        UserConfiguration.objects.get_or_create(user=self.user)
+        ClientProfileCacheService.invalidate(self.user.access_key)
+        self.url = reverse("client-profile")
+
+    def tearDown(self):
+        ClientProfileCacheService.invalidate(self.user.access_key)
+
+    def get(self, path: str = "", **headers):
+        headers = {
+            "HTTP_ACCEPT": "application/json; version=1",
+            "HTTP_ORIGIN": "https://pintalk.app",
+            "HTTP_X_PINTALK_ACCESS_KEY": "clientaccess",
+            "HTTP_X_PINTALK_SECRET_KEY": "clientsecret",
+            **headers,
+        }
+        return self.client.get(self.url + path, **headers)
+
+    def test_not_modified(self):
+        response = self.get()
+        etag = response["ETag"]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["profileName"], "host")
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # compressed responses carry a weak etag
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=f"W/{etag}").status_code, 304)
+
+    def test_profile_update_changes_etag(self):
+        etag = self.get()["ETag"]
+
+        self.user.profile_name = "renamed"
+        self.user.save()
+        ClientProfileCacheService.invalidate(self.user.access_key)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["profileName"], "renamed")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_wrong_secret_key(self):
+        self.get()
+
+        response = self.get(HTTP_X_PINTALK_SECRET_KEY="wrong")
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_sparse_fields(self):
+        etag = self.get()["ETag"]
+
+        response = self.get("?fields=email,profileName", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {"email": "client-host@pintalk.app", "profileName": "host"},
+        )
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            self.get(
+                "?fields=profileName,email", HTTP_IF_NONE_MATCH=response["ETag"]
+            ).status_code,
+            304,
+        )
+
+    def test_unknown_sparse_field(self):
+        self.assertEqual(self.get("?fields=secretKey").status_code, 400)
+
+
+class SparseFieldsSerializerTest(SimpleTestCase):
+    def test_left_out_fields_are_not_copied(self):
+        deepcopy = Field.__deepcopy__
+        copied = []
+
+        def record_deepcopy(field, memo):
+            copied.append(field)
+            return deepcopy(field, memo)
+
+        with mock.patch.object(Field, "__deepcopy__", record_deepcopy):
+            fields = ClientSerializer(fields={"email"}).fields
+
+        self.assertEqual(list(fields), ["email"])
+        self.assertEqual(copied, [])
+        self.assertIn("configs", ClientSerializer().fields)
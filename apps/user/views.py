@@ -1,9 +1,12 @@
 import datetime
+import hashlib
 
 from django.db.models import QuerySet
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags, quote_etag
 from djangorestframework_camel_case.parser import CamelCaseJSONParser
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -19,10 +22,13 @@ from apps.user.serializers import (
     ClientSerializer,
     UserConfigurationSerializer,
 )
+from apps.user.services import ClientProfile, ClientProfileCacheService
+from config.async_views import AsyncAPIViewMixin
 from config.permissions import (
     RequestUserOnly,
     AuthorizedOriginOnly,
 )
+from config.sparse_fields import SparseFieldsMixin
 
 
 @method_decorator(
@@ -35,7 +41,7 @@ from config.permissions import (
         },
     ),
 )
-class UserListView(generics.ListAPIView):
+class UserListView(SparseFieldsMixin, generics.ListAPIView):
     serializer_class = UserSerializer
     queryset = User.objects.all()
 
@@ -50,7 +56,7 @@ class UserListView(generics.ListAPIView):
         },
     ),
 )
-class UserDetailView(generics.RetrieveUpdateAPIView):
+class UserDetailView(SparseFieldsMixin, generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     queryset = User.objects.all()
     allowed_methods = ["PATCH", "GET"]
@@ -92,13 +98,45 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
         serializer = self.get_serializer(instance, data=request.data, partial=True)
         if serializer.is_valid(raise_exception=True):
             serializer.save(updated_at=datetime.datetime.now())
+            ClientProfileCacheService.invalidate(instance.access_key)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-@method_decorator(
-    name="get",
-    decorator=swagger_auto_schema(
+class ClientProfileView(AsyncAPIViewMixin, SparseFieldsMixin, generics.RetrieveAPIView):
+    # clients are identified by their service keys, not by jwt or session
+    authentication_classes = []
+    permission_classes = [AuthorizedOriginOnly]
+    serializer_class = ClientSerializer
+    queryset = User.objects.all()
+
+    async def get_object(self) -> ClientProfile:
+        """
+        cached profile of the access key, serialized from the db on a miss
+        """
+        profile = await ClientProfileCacheService.aload(
+            self.request.headers.get("X-PinTalk-Access-Key", None),
+            self.request.headers.get("X-PinTalk-Secret-Key", None),
+            self.get_serializer_context(),
+        )
+        if profile is None:
+            raise AuthenticationFailed("invalid access_key or secret_key")
+
+        self.check_object_permissions(self.request, profile)
+
+        return profile
+
+    def get_etag(self, profile: ClientProfile) -> str:
+        # same data, renderer and fields give the same bytes
+        tag = f"{profile.version}-{self.request.accepted_renderer.format}"
+        sparse_fields = self.get_sparse_fields()
+        if sparse_fields is not None:
+            fields = ",".join(sorted(sparse_fields))
+            tag += "-" + hashlib.sha1(fields.encode()).hexdigest()[:8]
+        return quote_etag(tag)
+
+    # method_decorator would wrap the coroutine in a sync function
+    @swagger_auto_schema(
         tags=["client"],
         operation_summary="Fetch host data (for client side)",
         manual_parameters=[
@@ -119,29 +157,31 @@ class UserDetailView(generics.RetrieveUpdateAPIView):
             200: openapi.Response("user", ClientSerializer),
             400: "Passwords doesn't match",
         },
-    ),
-)
-class ClientProfileView(generics.RetrieveAPIView):
-    permission_classes = [AuthorizedOriginOnly]
-    serializer_class = ClientSerializer
-    queryset = User.objects.all()
-
-    def get_object(self):
-        access_key = self.request.headers.get("X-PinTalk-Access-Key", None)
-        secret_key = self.request.headers.get("X-PinTalk-Secret-Key", None)
-
-        try:
-            obj = (
-                self.get_queryset()
-                .filter(access_key=access_key, secret_key=secret_key)
-                .first()
-            )
-        except User.DoesNotExist:
-            raise AuthenticationFailed("invalid access_key or secret_key")
-
-        self.check_object_permissions(self.request, obj)
-
-        return obj
+    )
+    async def get(self, request, *args, **kwargs):
+        profile = await self.get_object()
+        etag = self.get_etag(profile)
+
+        # weak comparison, compressed responses carry the etag as W/"..."
+        if_none_match = [
+            tag[2:] if tag.startswith("W/") else tag
+            for tag in parse_etags(request.headers.get("If-None-Match", ""))
+        ]
+        if etag in if_none_match or "*" in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = profile.data
+            sparse_fields = self.get_sparse_fields()
+            if sparse_fields is not None:
+                data = {
+                    name: value for name, value in data.items() if name in sparse_fields
+                }
+            response = Response(data)
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ("X-PinTalk-Access-Key", "X-PinTalk-Secret-Key"))
+        return response
 
 
 @method_decorator(
@@ -172,6 +212,10 @@ class UserConfigView(generics.UpdateAPIView):
     def get_queryset(self):
         return self.queryset.select_related("user").all()
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        ClientProfileCacheService.invalidate(serializer.instance.user.access_key)
+
     def get_object(self):
         lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
 
@@ -0,0 +1,85 @@
+"""
+Per-message CPU cost of validating an inbound chat frame.
+
+before: ChatMessageInMemorySerializer (strptime) -> score built with str.replace (strptime again)
+        -> ChatMessageSerializer validation before the INSERT
+after:  validate_chat_frame, parsed once and carried through redis and db persistence
+
+usage: python benchmarks/chat_frame_validation.py
+"""
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.auth",
+            "django.contrib.contenttypes",
+            "rest_framework",
+            "apps.user",
+            "apps.chat",
+        ],
+        AUTH_USER_MODEL="user.User",
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3"}},
+        USE_TZ=False,
+    )
+    django.setup()
+
+from rest_framework import serializers
+
+from apps.chat.serializers import ChatMessageSerializer
+from apps.chat.validators import validate_chat_frame
+
+FRAME = {
+    "type": "chat_message",
+    "message": "안녕하세요, 배송 관련해서 문의드립니다.",
+    "is_host": False,
+    "datetime": "2023-03-25T14:32:57.123",
+}
+ROUNDS = 20000
+
+
+class LegacyInMemorySerializer(serializers.Serializer):
+    type = serializers.ChoiceField(
+        choices=["chat_message", "notice", "request", "status"], required=True
+    )
+    message = serializers.CharField(max_length=1000, min_length=1, required=True)
+    is_host = serializers.BooleanField(required=True)
+    datetime = serializers.CharField(max_length=23, required=True)
+
+    def validate_datetime(self, value):
+        datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f")
+        return value
+
+
+def legacy_path():
+    serializer = LegacyInMemorySerializer(data=FRAME)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.data
+    datetime.datetime.strptime(data["datetime"], "%Y-%m-%dT%H:%M:%S.%f")
+    (
+        data["datetime"]
+        .replace("-", "")
+        .replace("T", "")
+        .replace(":", "")
+        .replace(".", "")
+    )
+    ChatMessageSerializer(data=serializer.validated_data).is_valid(raise_exception=True)
+
+
+def fast_path():
+    frame = validate_chat_frame(FRAME)
+    frame.as_dict()
+
+
+if __name__ == "__main__":
+    for name, func in [("before", legacy_path), ("after", fast_path)]:
+        seconds = min(timeit.repeat(func, number=ROUNDS, repeat=3))
+        print(f"{name:>6}: {seconds / ROUNDS * 1e6:8.2f} us/message")
@@ -0,0 +1,134 @@
+"""
+Render time of api responses, CamelCaseJSONRenderer (camelize walk + json.dumps) vs the
+single pass config.renderer.CamelCaseRenderer.
+
+Pages are shaped like the serializer output of ChatroomListView (SimpleChatroomSerializer)
+and ChatroomMessageView (ChatMessageSerializer, limit offset pagination).
+Both renderers must give the same bytes.
+
+usage: python benchmarks/json_renderer.py [iterations]
+"""
+import datetime
+import os
+import sys
+import timeit
+import uuid
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=["django.contrib.contenttypes", "rest_framework"],
+        SECRET_KEY="benchmark",
+    )
+    django.setup()
+
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from config import renderer
+
+TEXTS = ["네 확인해 보겠습니다", "감사합니다!", "배송은 언제쯤 도착하나요?", "ok"]
+
+
+def chatroom(i: int) -> OrderedDict:
+    return OrderedDict(
+        [
+            ("id", i),
+            ("host", 1),
+            ("guest", f"guest_{i:04d}"),
+            ("name", str(uuid.UUID(int=i))),
+            ("latest_msg", TEXTS[i % len(TEXTS)]),
+            ("latest_msg_at", f"2023-03-25T14:{i % 60:02d}:00.000000Z"),
+            ("last_checked_at", "2023-03-25T14:00:00.000000Z"),
+            ("last_read_seq", 1000 + i),
+            ("is_closed", False),
+            ("closed_at", None),
+            ("created_at", "2023-03-25T13:00:00.000000Z"),
+            ("updated_at", "2023-03-25T14:00:00.000000Z"),
+        ]
+    )
+
+
+def chat_message(i: int) -> OrderedDict:
+    return OrderedDict(
+        [
+            ("id", i),
+            ("chatroom", 1),
+            ("message", TEXTS[i % len(TEXTS)]),
+            ("is_host", bool(i % 2)),
+            ("datetime", f"2023-03-25T14:{i % 60:02d}:{i % 60:02d}.000000Z"),
+            ("seq", 1000 + i),
+        ]
+    )
+
+
+PAGES = {
+    "chatroom list (100)": ReturnList(
+        [chatroom(i) for i in range(100)], serializer=None
+    ),
+    "message page (50)": OrderedDict(
+        [
+            ("count", 1200),
+            (
+                "next",
+                "https://api.pintalk.app/api/chat/chatrooms/1/messages/?limit=50&offset=100",
+            ),
+            (
+                "previous",
+                "https://api.pintalk.app/api/chat/chatrooms/1/messages/?limit=50&offset=0",
+            ),
+            (
+                "results",
+                ReturnList([chat_message(i) for i in range(50)], serializer=None),
+            ),
+        ]
+    ),
+    "error": ReturnDict({"code": 404, "detail": "Not Found"}, serializer=None),
+    # python objects left to the encoder
+    "raw values": {
+        "created_at": datetime.datetime(
+            2023, 3, 25, 14, 0, tzinfo=datetime.timezone.utc
+        ),
+        "local_at": datetime.datetime(2023, 3, 25, 14, 0, 0, 123456),
+        "date_of": datetime.date(2023, 3, 25),
+        "room_uuid": uuid.UUID(int=7),
+        "ratio": 0.1,
+        "line_sep": "a\u2028b\u2029c",
+        "tag_set": ["a_b", "c_d"],
+        "nested_list": [{"inner_key": (1, 2)}],
+    },
+}
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before = CamelCaseJSONRenderer()
+    after = renderer.CamelCaseRenderer()
+
+    print(f"orjson: {'yes' if renderer.orjson is not None else 'no'}")
+    print(f"{'page':<22}{'bytes':>8}{'before':>12}{'after':>12}")
+    for name, data in PAGES.items():
+        expected = before.render(data, "application/json", {})
+        rendered = after.render(data, "application/json", {})
+        assert rendered == expected, (name, rendered, expected)
+
+        before_time = timeit.timeit(
+            lambda: before.render(data, "application/json", {}), number=iterations
+        )
+        after_time = timeit.timeit(
+            lambda: after.render(data, "application/json", {}), number=iterations
+        )
+        print(
+            f"{name:<22}{len(rendered):>8}"
+            f"{before_time / iterations * 1e6:>10.1f}us"
+            f"{after_time / iterations * 1e6:>10.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Per-request cost of the full middleware chain vs the lean chain used for the JWT api.
+
+A trivial view is served through both chains, in sync mode (BaseHandler.get_response)
+and in async mode (get_response_async, as under daphne, where each MiddlewareMixin
+based middleware runs its hooks through sync_to_async).
+
+usage: python benchmarks/middleware_overhead.py [requests]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+FULL_MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "corsheaders.middleware.CorsMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "django.middleware.csrf.CsrfViewMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "config.middlewares.add_headers.AddHeaders",
+    "config.middlewares.request_middleware.RequestMiddleware",
+]
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.auth",
+            "django.contrib.contenttypes",
+            "django.contrib.sessions",
+            "django.contrib.messages",
+            "corsheaders",
+        ],
+        MIDDLEWARE=FULL_MIDDLEWARE,
+        LEAN_MIDDLEWARE=[
+            "django.middleware.security.SecurityMiddleware",
+            "corsheaders.middleware.CorsMiddleware",
+            "django.middleware.common.CommonMiddleware",
+            "config.middlewares.add_headers.AddHeaders",
+            "config.middlewares.request_middleware.RequestMiddleware",
+        ],
+        ROOT_URLCONF=__name__,
+        SECRET_KEY="benchmark",
+        ALLOWED_HOSTS=["*"],
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3"}},
+        USE_TZ=False,
+    )
+    django.setup()
+
+from django.core.handlers.base import BaseHandler
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import path
+
+from config.handlers import LeanMiddlewareMixin
+
+
+def view(request):
+    return HttpResponse(b"{}", content_type="application/json")
+
+
+async def async_view(request):
+    return HttpResponse(b"{}", content_type="application/json")
+
+
+urlpatterns = [
+    path("api/chat/chatrooms/", view),
+    path("api/async/chatrooms/", async_view),
+]
+
+
+class LeanHandler(LeanMiddlewareMixin, BaseHandler):
+    pass
+
+
+def build(handler_class, is_async):
+    handler = handler_class()
+    handler.load_middleware(is_async=is_async)
+    return handler
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    factory = RequestFactory()
+    headers = {"HTTP_ACCEPT": "application/json; version=1"}
+
+    for name, handler_class in (("full", BaseHandler), ("lean", LeanHandler)):
+        handler = build(handler_class, is_async=False)
+        start = time.perf_counter()
+        for _ in range(number):
+            handler.get_response(factory.get("/api/chat/chatrooms/", **headers))
+        sync_us = (time.perf_counter() - start) / number * 1e6
+
+        handler = build(handler_class, is_async=True)
+
+        async def run():
+            for _ in range(number):
+                await handler.get_response_async(
+                    factory.get("/api/async/chatrooms/", **headers)
+                )
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        async_us = (time.perf_counter() - start) / number * 1e6
+
+        print(
+            f"{name:>5}: sync {sync_us:7.1f} us/request, async {async_us:7.1f} us/request"
+        )
@@ -0,0 +1,83 @@
+"""
+Memory per room for the chat sorted set, legacy json members vs compact members.
+
+Always prints the average member size. When a redis server is reachable through
+REDIS_HOST (default localhost), also fills two rooms and reports MEMORY USAGE
+and OBJECT ENCODING for each.
+
+usage: python benchmarks/redis_member_encoding.py [messages per room]
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=[
+            "django.contrib.auth",
+            "django.contrib.contenttypes",
+            "apps.user",
+            "apps.chat",
+        ],
+        AUTH_USER_MODEL="user.User",
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3"}},
+        USE_TZ=False,
+    )
+    django.setup()
+
+import redis
+
+from apps.chat.services import RedisService
+from apps.chat.validators import validate_chat_frame
+
+TEXTS = ["네 확인해 보겠습니다", "감사합니다!", "배송은 언제쯤 도착하나요?", "ok"]
+
+
+def generate_frames(count: int):
+    start = datetime(2023, 3, 25, 14, 0, 0)
+    for i in range(count):
+        sent_at = start + timedelta(seconds=i * 7, milliseconds=i)
+        yield validate_chat_frame(
+            {
+                "type": "chat_message",
+                "message": TEXTS[i % len(TEXTS)],
+                "is_host": bool(i % 2),
+                "datetime": sent_at.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3],
+            }
+        )
+
+
+def legacy_member(frame) -> bytes:
+    return json.dumps(frame.as_dict(), ensure_ascii=False).encode("utf-8")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    frames = list(generate_frames(count))
+    encoders = [("legacy", legacy_member), ("compact", RedisService.encode_member)]
+
+    for name, encode in encoders:
+        sizes = [len(encode(frame)) for frame in frames]
+        print(f"{name:>8}: {sum(sizes) / len(sizes):6.1f} bytes/member")
+
+    conn = redis.StrictRedis(host=os.environ.get("REDIS_HOST", "localhost"), port=6379)
+    try:
+        conn.ping()
+    except redis.exceptions.ConnectionError:
+        print("redis not reachable, skipping MEMORY USAGE")
+        sys.exit(0)
+
+    for name, encode in encoders:
+        key = f"bench_member_encoding_{name}"
+        conn.delete(key)
+        conn.zadd(key, {encode(frame): frame.score for frame in frames})
+        usage = conn.memory_usage(key)
+        encoding = conn.object("encoding", key).decode()
+        print(f"{name:>8}: {usage} bytes/room ({count} messages, {encoding})")
+        conn.delete(key)
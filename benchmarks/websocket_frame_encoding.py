@@ -0,0 +1,54 @@
+"""
+Bytes on the wire and encode/decode time of websocket frames, json text vs msgpack binary.
+
+json is encoded the way AsyncJsonWebsocketConsumer does (json.dumps defaults, so
+korean text is sent as \\u escapes).
+
+usage: python benchmarks/websocket_frame_encoding.py [iterations]
+"""
+import json
+import sys
+import timeit
+
+import msgpack
+
+TEXTS = ["네 확인해 보겠습니다", "감사합니다!", "배송은 언제쯤 도착하나요?", "ok"]
+
+
+def chat_message(i: int) -> dict:
+    return {
+        "type": "chat_message",
+        "message": TEXTS[i % len(TEXTS)],
+        "is_host": bool(i % 2),
+        "datetime": f"2023-03-25T14:{i % 60:02d}:{i % 60:02d}.{i % 1000:03d}",
+        "seq": 1000 + i,
+    }
+
+
+FRAMES = {
+    "message": chat_message(1),
+    "page of 50": {
+        "data": [chat_message(i) for i in range(50)],
+        "type": "chat_message",
+    },
+}
+
+ENCODERS = {
+    "json": (lambda content: json.dumps(content).encode("utf-8"), json.loads),
+    "msgpack": (msgpack.packb, msgpack.unpackb),
+}
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    for frame_name, content in FRAMES.items():
+        print(frame_name)
+        for name, (encode, decode) in ENCODERS.items():
+            encoded = encode(content)
+            encode_us = timeit.timeit(lambda: encode(content), number=number) * 1e6
+            decode_us = timeit.timeit(lambda: decode(encoded), number=number) * 1e6
+            print(
+                f"{name:>9}: {len(encoded):6d} bytes, "
+                f"encode {encode_us / number:7.2f} us, decode {decode_us / number:7.2f} us"
+            )
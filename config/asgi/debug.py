@@ -11,16 +11,16 @@ import os
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
-from django.core.asgi import get_asgi_application
 
 from apps.chat.jwt_auth_middleware import JwtAuthMiddlewareStack
 from apps.chat.routing import websocket_urlpatterns
+from config.handlers import get_http_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.debug")
 
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),
+        "http": get_http_application(),
         "websocket": AllowedHostsOriginValidator(
             JwtAuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
         ),
@@ -0,0 +1,61 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class AsyncAPIViewMixin:
+    """
+    Runs a DRF view with coroutine handlers natively on the event loop.
+
+    Put it before the DRF view class and write the handlers as ``async def``,
+    using the async ORM. Only authentication, which looks users up through the
+    sync ORM, is handed to a thread, and only when the view has authenticators.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            if request.authenticators:
+                await sync_to_async(self.perform_authentication)(request)
+            # request.user is resolved by now, the rest of initial() is cpu only
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncLimitOffsetPagination(LimitOffsetPagination):
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [obj async for obj in queryset[self.offset : self.offset + self.limit]]
@@ -0,0 +1,230 @@
+import asyncio
+import collections
+import functools
+import logging
+import time
+
+import msgpack
+from channels_redis.core import BoundedQueue, RedisChannelLayer
+
+logger = logging.getLogger("pintalk")
+
+
+class HybridRedisChannelLayer(RedisChannelLayer):
+    """
+    Redis channel layer with an in-process fast path for group messages.
+
+    Group membership of channels created by this process is tracked locally,
+    so ``group_send`` hands the message straight to those channels without
+    waiting on Redis. Redis is only used to reach members living in other processes.
+
+    The members of other processes are cached per group. Every ``group_add`` and
+    ``group_discard`` is published on a membership channel and drops the cached
+    entry in all processes, so a group without remote members is served without
+    any Redis round trip. While the subscription is down nothing is cached.
+    """
+
+    # seconds a cached remote membership is trusted even without an invalidation
+    REMOTE_MEMBERS_TTL = 30.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # group name -> channel names of this process in that group
+        self.local_groups = collections.defaultdict(set)
+        # messages delivered in-process, by channel name
+        self.local_buffer = collections.defaultdict(
+            functools.partial(BoundedQueue, self.capacity)
+        )
+        # redis receives kept alive across calls so no message is lost when a local one wins
+        self.remote_receives = {}
+        # group name -> (monotonic expiry, channel names of other processes)
+        self.remote_groups = {}
+        self.membership_channel = f"{self.prefix}:membership"
+        self.membership_listener = None
+        self.membership_subscribed = False
+        # bumped by every invalidation, a read overlapping one is not cached
+        self.membership_changes = 0
+
+    def is_local_channel(self, channel: str) -> bool:
+        return "!" in channel and self.non_local_name(channel).endswith(
+            self.client_prefix + "!"
+        )
+
+    async def receive(self, channel):
+        if not self.is_local_channel(channel):
+            return await super().receive(channel)
+
+        local_queue = self.local_buffer[channel]
+        remote = self.remote_receives.get(channel)
+        if remote is None:
+            remote = asyncio.ensure_future(super().receive(channel))
+            self.remote_receives[channel] = remote
+
+        if not local_queue.empty():
+            return local_queue.get_nowait()
+
+        local = asyncio.ensure_future(local_queue.get())
+        try:
+            await asyncio.wait([remote, local], return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # consumer is going away, drop everything held for this channel
+            local.cancel()
+            remote.cancel()
+            self.remote_receives.pop(channel, None)
+            self.local_buffer.pop(channel, None)
+            raise
+
+        if local.done():
+            return local.result()
+
+        local.cancel()
+        del self.remote_receives[channel]
+        return remote.result()
+
+    async def group_add(self, group, channel):
+        await super().group_add(group, channel)
+        if self.is_local_channel(channel):
+            self.local_groups[group].add(channel)
+        await self.publish_membership(group)
+
+    async def group_discard(self, group, channel):
+        local_members = self.local_groups.get(group)
+        if local_members is not None:
+            local_members.discard(channel)
+            if not local_members:
+                del self.local_groups[group]
+        await super().group_discard(group, channel)
+        await self.publish_membership(group)
+
+    def invalidate_remote_members(self, group):
+        self.membership_changes += 1
+        self.remote_groups.pop(group, None)
+
+    async def publish_membership(self, group):
+        self.invalidate_remote_members(group)
+        await self.connection(0).publish(self.membership_channel, group)
+
+    def ensure_membership_listener(self):
+        loop = asyncio.get_running_loop()
+        listener = self.membership_listener
+        if listener is not None and not listener.done() and listener.loop is loop:
+            return
+        self.membership_subscribed = False
+        self.remote_groups.clear()
+        task = loop.create_task(self.listen_membership())
+        # the loop the subscription lives on, pools are per loop as well
+        task.loop = loop
+        self.membership_listener = task
+
+    async def listen_membership(self):
+        pubsub = self.connection(0).pubsub()
+        try:
+            await pubsub.subscribe(self.membership_channel)
+            self.membership_subscribed = True
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self.invalidate_remote_members(message["data"].decode("utf8"))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("channel layer membership subscription lost", exc_info=True)
+        finally:
+            # invalidations may be missed from here on, stop trusting the cache
+            self.membership_subscribed = False
+            self.remote_groups.clear()
+            try:
+                await pubsub.reset()
+            except Exception:
+                pass
+
+    async def get_remote_members(self, group) -> list:
+        self.ensure_membership_listener()
+        cached = self.remote_groups.get(group)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        # only cached when subscribed for the whole read and no membership changed meanwhile
+        subscribed = self.membership_subscribed
+        changes = self.membership_changes
+        key = self._group_key(group)
+        connection = self.connection(self.consistent_hash(group))
+        await connection.zremrangebyscore(
+            key, min=0, max=int(time.time()) - self.group_expiry
+        )
+        channel_names = [
+            name
+            for name in (x.decode("utf8") for x in await connection.zrange(key, 0, -1))
+            if not self.is_local_channel(name)
+        ]
+        if (
+            subscribed
+            and self.membership_subscribed
+            and changes == self.membership_changes
+        ):
+            self.remote_groups[group] = (
+                time.monotonic() + self.REMOTE_MEMBERS_TTL,
+                channel_names,
+            )
+        return channel_names
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+
+        local_members = set(self.local_groups.get(group, ()))
+        if local_members:
+            # consumers mutate received events, so every channel gets its own deep copy.
+            # packed once like for redis, local and remote members then get the same types
+            packed = msgpack.packb(message)
+            for channel in local_members:
+                self.local_buffer[channel].put_nowait(msgpack.unpackb(packed))
+
+        channel_names = await self.get_remote_members(group)
+        if channel_names:
+            await self._send_to_remote_channels(group, channel_names, message)
+
+    async def _send_to_remote_channels(self, group, channel_names, message):
+        """
+        Same fan-out as ``RedisChannelLayer.group_send``, restricted to the given channels
+        """
+        (
+            connection_to_channel_keys,
+            channel_keys_to_message,
+            channel_keys_to_capacity,
+        ) = self._map_channel_keys_to_connection(channel_names, message)
+
+        group_send_lua = """
+            local over_capacity = 0
+            local current_time = ARGV[#ARGV - 1]
+            local expiry = ARGV[#ARGV]
+            for i=1,#KEYS do
+                if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+                    redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+                    redis.call('EXPIRE', KEYS[i], expiry)
+                else
+                    over_capacity = over_capacity + 1
+                end
+            end
+            return over_capacity
+        """
+
+        for connection_index, channel_redis_keys in connection_to_channel_keys.items():
+            connection = self.connection(connection_index)
+
+            pipe = connection.pipeline()
+            for key in channel_redis_keys:
+                pipe.zremrangebyscore(
+                    key, min=0, max=int(time.time()) - int(self.expiry)
+                )
+            await pipe.execute()
+
+            args = [channel_keys_to_message[key] for key in channel_redis_keys]
+            args += [channel_keys_to_capacity[key] for key in channel_redis_keys]
+            args += [time.time(), self.expiry]
+
+            channels_over_capacity = await connection.eval(
+                group_send_lua, len(channel_redis_keys), *channel_redis_keys, *args
+            )
+            if channels_over_capacity > 0:
+                logger.info(
+                    f"{channels_over_capacity} of {len(channel_names)} channels over capacity in group {group}"
+                )
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+logger = logging.getLogger("pintalk")
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    Thread pool keeping count of the work waiting for a thread and how long it waited.
+    A snapshot is logged through the pintalk logger every report_interval seconds while
+    there is work, as a warning when something waited longer than slow_wait_ms.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        thread_name_prefix: str = "",
+        report_interval: float = 60.0,
+        slow_wait_ms: float = 100.0,
+    ):
+        super().__init__(max_workers, thread_name_prefix)
+        self.metrics_lock = threading.Lock()
+        self.queue_depth = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.report_interval = report_interval
+        self.slow_wait = slow_wait_ms / 1000
+        self.reported_at = time.monotonic()
+        # longest wait since the last report
+        self.interval_max_wait = 0.0
+
+    def submit(self, fn, /, *args, **kwargs):
+        queued_at = time.monotonic()
+        with self.metrics_lock:
+            self.queue_depth += 1
+
+        def run():
+            wait = time.monotonic() - queued_at
+            with self.metrics_lock:
+                self.queue_depth -= 1
+                self.started += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.interval_max_wait = max(self.interval_max_wait, wait)
+            self.report()
+            return fn(*args, **kwargs)
+
+        return super().submit(run)
+
+    def report(self) -> None:
+        now = time.monotonic()
+        with self.metrics_lock:
+            if now - self.reported_at < self.report_interval:
+                return
+            self.reported_at = now
+            interval_max_wait, self.interval_max_wait = self.interval_max_wait, 0.0
+
+        snapshot = self.snapshot()
+        snapshot["interval_max_wait_ms"] = interval_max_wait * 1000
+        if interval_max_wait >= self.slow_wait:
+            logger.warning(f"consumer db executor saturated, {snapshot}")
+        else:
+            logger.info(f"consumer db executor, {snapshot}")
+
+    def snapshot(self) -> dict:
+        with self.metrics_lock:
+            return {
+                "max_workers": self._max_workers,
+                "queue_depth": self.queue_depth,
+                "started": self.started,
+                "avg_wait_ms": self.total_wait / self.started * 1000
+                if self.started
+                else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+_consumer_db_executor: Optional[InstrumentedThreadPoolExecutor] = None
+_consumer_db_executor_lock = threading.Lock()
+
+
+def get_consumer_db_executor() -> Optional[InstrumentedThreadPoolExecutor]:
+    """
+    the shared executor for database work of websocket consumers, None when disabled
+    """
+    global _consumer_db_executor
+
+    config = settings.CONSUMER_DB_EXECUTOR
+    if not config["ENABLED"]:
+        return None
+    if _consumer_db_executor is None:
+        with _consumer_db_executor_lock:
+            if _consumer_db_executor is None:
+                _consumer_db_executor = InstrumentedThreadPoolExecutor(
+                    config["MAX_WORKERS"],
+                    thread_name_prefix="consumer-db",
+                    report_interval=config["REPORT_INTERVAL"],
+                    slow_wait_ms=config["SLOW_WAIT_MS"],
+                )
+    return _consumer_db_executor
+
+
+class ConsumerDatabaseSyncToAsync(DatabaseSyncToAsync):
+    """
+    database_sync_to_async running on the consumer db executor instead of the
+    thread sensitive default. Each thread keeps its own connection (CONN_MAX_AGE),
+    so MySQL connections of consumers never exceed the pool size.
+    """
+
+    async def __call__(self, *args, **kwargs):
+        executor = get_consumer_db_executor()
+        if executor is not None:
+            self._thread_sensitive = False
+            self._executor = executor
+        return await super().__call__(*args, **kwargs)
+
+
+consumer_database_sync_to_async = ConsumerDatabaseSyncToAsync
@@ -0,0 +1,46 @@
+import re
+
+from django.conf import settings
+from django.core.asgi import ASGIHandler, get_asgi_application
+
+
+class LeanMiddlewareMixin:
+    """
+    Handler loading settings.LEAN_MIDDLEWARE instead of settings.MIDDLEWARE
+    """
+
+    def load_middleware(self, is_async=False):
+        # BaseHandler reads the chain from settings, swap it while the handler is built
+        middleware = settings.MIDDLEWARE
+        settings.MIDDLEWARE = settings.LEAN_MIDDLEWARE
+        try:
+            super().load_middleware(is_async)
+        finally:
+            settings.MIDDLEWARE = middleware
+
+
+class LeanASGIHandler(LeanMiddlewareMixin, ASGIHandler):
+    pass
+
+
+class PathScopedASGIHandler:
+    """
+    Serves requests matching settings.LEAN_MIDDLEWARE_PATH_REGEX through the lean
+    middleware chain, everything else through the full one.
+    """
+
+    def __init__(self):
+        self.full_handler = get_asgi_application()
+        self.lean_handler = LeanASGIHandler()
+        self.is_lean_path = re.compile(settings.LEAN_MIDDLEWARE_PATH_REGEX).match
+
+    async def __call__(self, scope, receive, send):
+        if self.is_lean_path(scope["path"]):
+            return await self.lean_handler(scope, receive, send)
+        return await self.full_handler(scope, receive, send)
+
+
+def get_http_application():
+    if settings.LEAN_MIDDLEWARE_PATH_REGEX:
+        return PathScopedASGIHandler()
+    return get_asgi_application()
@@ -1,8 +1,27 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
 class AddHeaders:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         response = self.get_response(request)
+        return self.process_response(response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(response)
+
+    @staticmethod
+    def process_response(response):
         response["Link"] = 'https://api.pintalk.app/api/swagger; rel="profile"'
         return response
@@ -1,17 +1,30 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from rest_framework.exceptions import ValidationError
 
 
 class CheckHeaders:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
 
         self.process_request(request)
         response = self.get_response(request)
 
         return response
 
+    async def __acall__(self, request):
+        self.process_request(request)
+        return await self.get_response(request)
+
     def process_request(self, request):
         if "client" in request.path:
             if not (
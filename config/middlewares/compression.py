@@ -0,0 +1,81 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# html and other text bodies are left alone, they may reflect input next to a csrf token (BREACH)
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack")
+
+re_accepts_br = _lazy_re_compile(r"\bbr\b")
+re_accepts_gzip = _lazy_re_compile(r"\bgzip\b")
+
+
+class CompressionMiddleware:
+    """
+    Compresses api responses with brotli (when the brotli package is installed) or gzip,
+    following the client's Accept-Encoding. Small bodies are sent as is
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = getattr(settings, "RESPONSE_COMPRESSION", {})
+        self.min_length = options.get("MIN_LENGTH", 200)
+        self.brotli_quality = options.get("BROTLI_QUALITY", 4)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < self.min_length
+            or not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        # the body depends on Accept-Encoding from here on, even when left uncompressed
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is not None and re_accepts_br.search(accept_encoding):
+            encoding = "br"
+            compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        elif re_accepts_gzip.search(accept_encoding):
+            encoding = "gzip"
+            compressed = compress_string(response.content)
+        else:
+            return response
+
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+
+        # a strong etag names the uncompressed bytes, same as django's GZipMiddleware
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+
+        return response
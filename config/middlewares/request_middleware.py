@@ -1,3 +1,4 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
@@ -6,37 +7,57 @@ from config.renderer import CustomRenderer
 
 
 class RequestMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
         self.VALID_URLS = ["api", "swagger", "redoc"]
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
         try:
             self.process_request(request)
         except ValidationError as e:
-            response = Response(
-                {"detail": e.detail[0]}, status=status.HTTP_400_BAD_REQUEST
-            )
-            response.accepted_renderer = CustomRenderer()
-            response.accepted_media_type = "application/json"
-            response.renderer_context = {}
-            response.render()
-            return response
+            return self.bad_request(e)
 
         response = self.get_response(request)
 
         return response
 
+    async def __acall__(self, request):
+        try:
+            self.process_request(request)
+        except ValidationError as e:
+            return self.bad_request(e)
+
+        return await self.get_response(request)
+
+    @staticmethod
+    def bad_request(e: ValidationError) -> Response:
+        response = Response({"detail": e.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+        response.accepted_renderer = CustomRenderer()
+        response.accepted_media_type = "application/json"
+        response.renderer_context = {}
+        response.render()
+        return response
+
     def process_request(self, request):
-        if (
-            "api" in request.path
-            and "swagger" not in request.path
-            and "redoc" not in request.path
-        ):
-            if "application/json" not in request.headers["Accept"]:
-                raise ValidationError("Accept type is 'application/json'")
-
-            if "version" not in request.headers["Accept"]:
+        path = request.path
+        if "api" in path and "swagger" not in path and "redoc" not in path:
+            # straight from META, request.headers would build a mapping of every header
+            accept = request.META.get("HTTP_ACCEPT", "")
+            if "application/json" not in accept and "application/msgpack" not in accept:
+                raise ValidationError(
+                    "Accept type is 'application/json' or 'application/msgpack'"
+                )
+
+            if "version" not in accept:
                 raise ValidationError(
                     "Accept header must include api version for api requests"
                 )
@@ -1,4 +1,27 @@
-from rest_framework.renderers import JSONRenderer
+import datetime
+import decimal
+import re
+import uuid
+
+import msgpack
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from djangorestframework_camel_case.settings import api_settings as camel_settings
+from djangorestframework_camel_case.util import camelize_re, underscore_to_camel
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# snake_case -> camelCase, serializer field names are a small closed set
+CAMEL_KEYS = {}
+CAMEL_KEYS_MAX_SIZE = 4096
+
+JSON_NATIVE_TYPES = (str, int, bool, type(None))
 
 
 class CustomRenderer(JSONRenderer):
@@ -16,3 +39,148 @@ class CustomRenderer(JSONRenderer):
         return super(CustomRenderer, self).render(
             response, accepted_media_type, renderer_context
         )
+
+
+def camelize_key(key: str) -> str:
+    camel_key = CAMEL_KEYS.get(key)
+    if camel_key is None:
+        camel_key = re.sub(camelize_re, underscore_to_camel, key) if "_" in key else key
+        if len(CAMEL_KEYS) < CAMEL_KEYS_MAX_SIZE:
+            CAMEL_KEYS[key] = camel_key
+    return camel_key
+
+
+class JSONNormalizer:
+    """
+    Single walk over the response data, camelizing keys the same way as
+    ``djangorestframework_camel_case.util.camelize`` and turning datetimes, uuids and
+    other non json types into the representation ``rest_framework.utils.encoders.JSONEncoder`` gives.
+    ``orjson_safe`` is cleared whenever orjson would not print the result byte for byte like ``json.dumps``
+    """
+
+    __slots__ = ("ignore_fields", "encoder", "orjson_safe")
+
+    def __init__(self, encoder, ignore_fields=None):
+        self.encoder = encoder
+        self.ignore_fields = ignore_fields or ()
+        self.orjson_safe = True
+
+    def normalize(self, data, camel=True):
+        data_type = type(data)
+        if data_type in JSON_NATIVE_TYPES:
+            return data
+        if data_type is dict or data_type is ReturnDict or isinstance(data, dict):
+            if not camel:
+                return {
+                    key: self.normalize(value, False) for key, value in data.items()
+                }
+            ignore_fields = self.ignore_fields
+            normalized = {}
+            for key, value in data.items():
+                if isinstance(key, Promise):
+                    key = force_str(key)
+                if isinstance(key, str):
+                    new_key = camelize_key(key)
+                else:
+                    new_key = key
+                    self.orjson_safe = False
+                if ignore_fields and (key in ignore_fields or new_key in ignore_fields):
+                    normalized[new_key] = self.normalize(value, False)
+                else:
+                    normalized[new_key] = self.normalize(value)
+            return normalized
+        if data_type is list or data_type is tuple:
+            return [self.normalize(item, camel) for item in data]
+        if isinstance(data, JSON_NATIVE_TYPES):
+            return data
+        if isinstance(data, Promise):
+            return force_str(data)
+        if isinstance(data, float):
+            # float reprs and NaN handling differ between encoders
+            self.orjson_safe = False
+            return data
+        if isinstance(data, datetime.datetime):
+            representation = data.isoformat()
+            if representation.endswith("+00:00"):
+                representation = representation[:-6] + "Z"
+            return representation
+        if isinstance(data, (datetime.date, datetime.time)):
+            return self.encoder.default(data)
+        if isinstance(data, uuid.UUID):
+            return str(data)
+        if isinstance(data, decimal.Decimal):
+            self.orjson_safe = False
+            return float(data)
+        if camel:
+            # camelize turns any other iterable into a list
+            try:
+                iterator = iter(data)
+            except TypeError:
+                pass
+            else:
+                return [self.normalize(item) for item in iterator]
+        return self.normalize(self.encoder.default(data), False)
+
+
+class CamelCaseRenderer(JSONRenderer):
+    """
+    Camelizes and encodes in one pass, same output as ``CamelCaseJSONRenderer``.
+    Encodes with orjson when it is installed and gives the same bytes as ``json.dumps``
+    """
+
+    json_underscoreize = camel_settings.JSON_UNDERSCOREIZE
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        normalizer = JSONNormalizer(
+            self.encoder_class(), self.json_underscoreize.get("ignore_fields")
+        )
+        data = normalizer.normalize(data)
+
+        if (
+            orjson is not None
+            and normalizer.orjson_safe
+            and indent is None
+            and self.compact
+            and not self.ensure_ascii
+        ):
+            try:
+                ret = orjson.dumps(data)
+            except (orjson.JSONEncodeError, TypeError):
+                pass
+            else:
+                # same escaping as JSONRenderer, keeps the output a strict javascript subset
+                if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+                    ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                        b"\xe2\x80\xa9", b"\\u2029"
+                    )
+                return ret
+
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class CamelCaseMsgPackRenderer(BaseRenderer):
+    """
+    Same camelCase data as ``CamelCaseRenderer``, packed as MessagePack
+    for clients sending ``Accept: application/msgpack; version=1``
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    json_underscoreize = camel_settings.JSON_UNDERSCOREIZE
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        normalizer = JSONNormalizer(
+            encoders.JSONEncoder(), self.json_underscoreize.get("ignore_fields")
+        )
+        return msgpack.packb(normalizer.normalize(data), use_bin_type=True)
@@ -104,6 +104,29 @@ MIDDLEWARE = [
     "config.middlewares.request_middleware.RequestMiddleware",
 ]
 
+# api responses over MIN_LENGTH bytes are compressed for clients sending Accept-Encoding,
+# brotli when the optional brotli package is installed, gzip otherwise. Only the lean api stack
+# compresses, pages carrying a csrf token or session (admin, swagger, api-auth) are never compressed
+RESPONSE_COMPRESSION = {
+    "MIN_LENGTH": 200,
+    "BROTLI_QUALITY": 4,
+}
+
+# Requests matching LEAN_MIDDLEWARE_PATH_REGEX only run LEAN_MIDDLEWARE. The JWT api serves no
+# html and keeps no session, so sessions, csrf, messages, auth and frame options are left out.
+# swagger, redoc and the browsable api login keep the full MIDDLEWARE. None disables it
+LEAN_MIDDLEWARE = [
+    "django.middleware.security.SecurityMiddleware",
+    "config.middlewares.compression.CompressionMiddleware",
+    "corsheaders.middleware.CorsMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "config.middlewares.add_headers.AddHeaders",
+    "config.middlewares.request_middleware.RequestMiddleware",
+]
+LEAN_MIDDLEWARE_PATH_REGEX = r"/api/(?!swagger|redoc|api-auth/)"
+# websocket connections authenticate with jwt only, without the channels session/cookie stack
+LEAN_WEBSOCKET_AUTH = True
+
 ROOT_URLCONF = "config.urls"
 
 # Rest Framework
@@ -119,8 +142,8 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_RENDERER_CLASSES": [
-        "djangorestframework_camel_case.render.CamelCaseJSONRenderer",
-        "config.renderer.CustomRenderer",
+        "config.renderer.CamelCaseRenderer",
+        "config.renderer.CamelCaseMsgPackRenderer",
     ],
     "DEFAULT_PARSER_CLASSES": [
         "djangorestframework_camel_case.parser.CamelCaseJSONParser",
@@ -168,13 +191,80 @@ WSGI_APPLICATION = "config.wsgi.debug.application"
 ASGI_APPLICATION = "config.asgi.debug.application"
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        # group members in this process are served in-memory, others through redis
+        "BACKEND": "config.channel_layers.HybridRedisChannelLayer",
         "CONFIG": {
             "hosts": [(os.environ.get("REDIS_HOST"), 6379)],
         },
     },
 }
 
+# db 1 keeps cached api data apart from chat messages in db 0
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://{os.environ.get('REDIS_HOST')}:6379/1",
+        "KEY_PREFIX": "pintalk",
+    },
+}
+# widget profiles are invalidated on every profile or configuration update
+CLIENT_PROFILE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# chatrooms are saved with their first guest message, until then guests hold a signed reservation
+CHATROOM_RESERVATION_MAX_AGE = 60 * 60 * 24 * 30
+# guests get their chatroom (reservation) back from this cookie on the next widget bootstrap
+WIDGET_CHATROOM_COOKIE = {
+    "NAME": "pintalk_chatroom",
+    "MAX_AGE": CHATROOM_RESERVATION_MAX_AGE,
+}
+
+# Limits on frames sent by websocket clients
+CHAT_SOCKET_LIMITS = {
+    "MAX_FRAME_BYTES": 4096,  # checked before json decoding
+    "CONNECTION_RATE": 5,  # frames per second, per connection
+    "CONNECTION_BURST": 10,
+    "ROOM_RATE": 20,  # frames per second, per room within a process
+    "ROOM_BURST": 40,
+    # typing and read frames, held back over this limit instead of closing the connection
+    "EPHEMERAL_RATE": 10,
+    "EPHEMERAL_BURST": 20,
+}
+
+# Outbound frames buffered per websocket connection.
+# daphne's send does not wait on the client, so the queue only fills for clients
+# acknowledging what they received (?ack=1), or on servers whose send applies flow control.
+# policy: "drop_oldest", "coalesce" (replace a queued frame of the same kind) or "close" (4008)
+CHAT_SOCKET_OUTBOUND = {
+    "MAX_QUEUED_FRAMES": 100,
+    "POLICY": "close",
+    # connections opened with ?batch=1 get the frames of this window (seconds) as one array
+    "BATCH_WINDOW": 0.02,
+    # frames sent but not yet acknowledged by connections opened with ?ack=1
+    "ACK_WINDOW": 20,
+}
+
+# `python manage.py sweep_chatrooms`, meant to run periodically
+CHAT_SWEEPER = {
+    # seconds without a message after which an open chatroom is closed and leaves redis
+    "IDLE_CHATROOM_TIMEOUT": 60 * 60 * 24 * 7,
+    # seconds after which a chatroom without any message is deleted
+    "EMPTY_CHATROOM_AGE": 60 * 60 * 24,
+    # seconds left to the redis keys of closed or deleted chatrooms and of gone hosts
+    "ORPHAN_KEY_TTL": 60 * 60,
+    "BATCH_SIZE": 500,
+}
+
+# Database work of websocket consumers runs on its own thread pool instead of the
+# single thread sensitive executor. Each thread keeps one MySQL connection (CONN_MAX_AGE)
+CONSUMER_DB_EXECUTOR = {
+    "ENABLED": True,
+    "MAX_WORKERS": 10,
+    # seconds between queue depth / wait time reports in the pintalk log
+    "REPORT_INTERVAL": 60,
+    # a report is a warning when something waited this long for a thread
+    "SLOW_WAIT_MS": 100,
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
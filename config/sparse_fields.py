@@ -0,0 +1,143 @@
+import functools
+
+from django.core.exceptions import FieldDoesNotExist
+from djangorestframework_camel_case.settings import api_settings as camel_settings
+from djangorestframework_camel_case.util import camel_to_underscore
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import BaseSerializer
+
+from config.exceptions import InvalidInputException
+
+FIELDS_PARAM = "fields"
+
+
+class SparseFieldsSerializerMixin:
+    """
+    ModelSerializer taking ``fields``, the names of the fields to build.
+    Fields left out, nested serializers included, are neither copied nor instantiated
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.sparse_fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        if self.sparse_fields is None:
+            return super().get_fields()
+
+        # ModelSerializer.get_fields deep copies every declared field, hide the others from it
+        self._declared_fields = {
+            name: field
+            for name, field in type(self)._declared_fields.items()
+            if name in self.sparse_fields
+        }
+        try:
+            return super().get_fields()
+        finally:
+            del self._declared_fields
+
+    def get_field_names(self, declared_fields, info):
+        field_names = super().get_field_names(declared_fields, info)
+        if self.sparse_fields is None:
+            return field_names
+        return [name for name in field_names if name in self.sparse_fields]
+
+
+@functools.lru_cache(maxsize=None)
+def get_readable_fields(serializer_class) -> dict:
+    """
+    readable field name -> (source, is nested serializer), built once per serializer class
+    """
+    return {
+        name: (field.source, isinstance(field, BaseSerializer))
+        for name, field in serializer_class().fields.items()
+        if not field.write_only
+    }
+
+
+def get_select_related_paths(select_related: dict, prefix: str = "") -> list:
+    paths = []
+    for name, nested in select_related.items():
+        path = prefix + name
+        paths.append(path)
+        paths.extend(get_select_related_paths(nested, path + "__"))
+    return paths
+
+
+class SparseFieldsMixin:
+    """
+    ``?fields=id,name,latestMsg`` on GET limits the serialized fields of a list or detail view
+    and loads only the matching columns with ``only()``.
+    Relations are only joined when a nested serializer of them is requested.
+
+    ``sparse_required_fields`` are model fields always loaded, e.g. the ones permissions check
+    """
+
+    sparse_required_fields = ()
+
+    def get_sparse_fields(self):
+        if hasattr(self, "_sparse_fields"):
+            return self._sparse_fields
+
+        self._sparse_fields = None
+        value = self.request.query_params.get(FIELDS_PARAM)
+        if self.request.method not in SAFE_METHODS or not value:
+            return None
+
+        readable_fields = get_readable_fields(self.get_serializer_class())
+        sparse_fields = set()
+        for name in value.split(","):
+            name = name.strip()
+            field_name = camel_to_underscore(name, **camel_settings.JSON_UNDERSCOREIZE)
+            if field_name not in readable_fields:
+                raise InvalidInputException(f"unknown field '{name}'")
+            sparse_fields.add(field_name)
+
+        self._sparse_fields = sparse_fields
+        return sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        sparse_fields = self.get_sparse_fields()
+        if sparse_fields is not None:
+            kwargs["fields"] = sparse_fields
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        sparse_fields = self.get_sparse_fields()
+        if sparse_fields is None:
+            return queryset
+        return self.get_sparse_queryset(queryset, sparse_fields)
+
+    def get_sparse_queryset(self, queryset, sparse_fields):
+        opts = queryset.model._meta
+        readable_fields = get_readable_fields(self.get_serializer_class())
+        columns = list(self.sparse_required_fields)
+        relations = set()
+
+        for name in sparse_fields:
+            source, is_nested = readable_fields[name]
+            try:
+                model_field = opts.get_field(source)
+            except FieldDoesNotExist:
+                # computed from more than a column, keep the full row
+                return queryset
+            if is_nested:
+                relations.add(source)
+            if model_field.concrete:
+                columns.append(source)
+
+        select_related = queryset.query.select_related
+        if select_related is True:
+            return queryset
+        if select_related:
+            queryset = queryset.select_related(None)
+            kept = [
+                path
+                for path in get_select_related_paths(select_related)
+                if path.split("__")[0] in relations
+            ]
+            if kept:
+                queryset = queryset.select_related(*kept)
+
+        return queryset.only(*columns)